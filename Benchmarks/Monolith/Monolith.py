@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from prometheus_client import Summary
+
+MONOLITH_PATH = os.path.dirname(os.path.abspath(__file__))
+SERVICE_CELL_PATH = os.path.abspath(f"{MONOLITH_PATH}/../../ServiceCell")
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+DEFAULT_PATH = "/api/v1"  # path of the services without one, the default path of the K8s deployer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "threads" runs the groups of external services on a shared thread pool,
+# "asyncio" runs them as coroutines of one event loop, with the internal services on the pool
+ENGINES = ("threads", "asyncio")
+
+# same metrics of the service cells, app_name and kubernetes_service are the in-process service
+RESPONSE_SIZE = Summary(
+    "mub_response_size",
+    "Response size",
+    ["zone", "app_name", "method", "endpoint", "from", "kubernetes_service"],
+)
+INTERNAL_PROCESSING = Summary(
+    "mub_internal_processing_latency_seconds",
+    "Latency of internal service",
+    ["zone", "app_name", "method", "endpoint"],
+)
+EXTERNAL_PROCESSING = Summary(
+    "mub_external_processing_latency_seconds",
+    "Latency of external services",
+    ["zone", "app_name", "method", "endpoint"],
+)
+REQUEST_PROCESSING = Summary(
+    "mub_request_processing_latency_seconds",
+    "Request latency including external and internal service",
+    ["zone", "app_name", "method", "endpoint", "from", "kubernetes_service"],
+)
+
+
+class ExternalServicesError(Exception):
+    pass
+
+
+def load_service_cell(internal_service_functions_path: str):
+    """
+    Imports the modules of the service cell, which load the internal-service functions from
+    MSConfig/InternalServiceFunctions relative to the working directory, as in the cell image.
+    """
+    functions_path = os.path.abspath(internal_service_functions_path)
+    msconfig_dir = tempfile.mkdtemp(prefix="mub-monolith-")
+    os.makedirs(f"{msconfig_dir}/MSConfig")
+    os.symlink(functions_path, f"{msconfig_dir}/MSConfig/InternalServiceFunctions")
+    sys.path[0:0] = [msconfig_dir, SERVICE_CELL_PATH]
+    cwd = os.getcwd()
+    os.chdir(msconfig_dir)
+    try:
+        import CallPlan
+        import InternalServiceExecutor
+    finally:
+        os.chdir(cwd)
+    return CallPlan, InternalServiceExecutor
+
+
+def percentiles(samples: List[float]) -> dict:
+    # latency statistics in ms
+    if len(samples) == 0:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return 1000 * ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": 1000 * sum(ordered) / len(ordered),
+        "p50_ms": rank(0.50),
+        "p95_ms": rank(0.95),
+        "p99_ms": rank(0.99),
+    }
+
+
+class ServiceStats:
+    def __init__(self):
+        self.request = list()
+        self.internal = list()
+        self.external = list()
+        self.response_size = list()
+        self.errors = 0
+
+    def summary(self) -> dict:
+        return {
+            "request": percentiles(self.request),
+            "internal": percentiles(self.internal),
+            "external": percentiles(self.external),
+            "mean_response_size": sum(self.response_size) / max(1, len(self.response_size)),
+            "errors": self.errors,
+        }
+
+
+class Monolith:
+    """
+    Runs all the services of a work model in one process: a request of a service runs its
+    internal service and then calls the selected services of its groups as function calls,
+    with the call plans, the group selection and the internal-service functions of the cells.
+    Network, serialization and HTTP servers are left out, so that comparing a run against one
+    of the same work model on the cluster measures their cost.
+    """
+
+    def __init__(self, work_model: dict, params: dict, call_plan, internal_service_executor):
+        if params["engine"] not in ENGINES:
+            raise ValueError(f"Unsupported monolith engine: {params['engine']}")
+        self.work_model = work_model
+        self.engine = params["engine"]
+        self.call_plan = call_plan
+        self.internal_service_executor = internal_service_executor
+        self.pool = ThreadPoolExecutor(max(1, int(params["thread_pool_size"])))
+        self.call_plans = {
+            service: call_plan.compile_work_model(work_model, service) for service in work_model
+        }
+        self.stats = {service: ServiceStats() for service in work_model}
+
+    def plan(self, service: str, query_string: str, request_type: Optional[str]):
+        behaviour_id = parse_qs(query_string).get("bid", [self.call_plan.DEFAULT_BEHAVIOUR])[0]
+        return self.call_plan.get_call_plan(self.call_plans[service], behaviour_id, request_type)
+
+    def _path(self, service: str) -> str:
+        return self.work_model[service].get("path", DEFAULT_PATH)
+
+    def _observe(self, service: str, caller: str, start: float):
+        # the request of a service ends here, successfully
+        request_latency = time.time() - start
+        REQUEST_PROCESSING.labels(ZONE, service, "GET", self._path(service), caller, service).observe(
+            request_latency
+        )
+        self.stats[service].request.append(request_latency)
+
+    def _observe_internal(self, service: str, caller: str, body, start: float):
+        path = self._path(service)
+        latency = time.time() - start
+        INTERNAL_PROCESSING.labels(ZONE, service, "GET", path).observe(latency)
+        RESPONSE_SIZE.labels(ZONE, service, "GET", path, caller, service).observe(len(body))
+        self.stats[service].internal.append(latency)
+        self.stats[service].response_size.append(len(body))
+
+    def _observe_external(self, service: str, start: float):
+        latency = time.time() - start
+        EXTERNAL_PROCESSING.labels(ZONE, service, "GET", self._path(service)).observe(latency)
+        self.stats[service].external.append(latency)
+
+    def _error(self, service: str, errors: dict):
+        self.stats[service].errors += 1
+        raise ExternalServicesError(f"Error in external services of {service}: {errors}")
+
+    ### threads engine
+
+    def call(self, service: str, caller: str, query_string: str, request_type: Optional[str] = None):
+        """Serves a request of a service, returns its body or raises on errors."""
+        start = time.time()
+        plan = self.plan(service, query_string, request_type)
+        body = self.internal_service_executor.run_internal_service(plan.internal_service)
+        self._observe_internal(service, caller, body, start)
+
+        start_external = time.time()
+        groups = plan.external_services
+        if len(groups) > 0:
+            # the groups are run on the pool and by the caller: a group still queued when the
+            # caller waits for it is run by the caller, so nested calls cannot exhaust the pool
+            futures = [
+                self.pool.submit(self.group, group, service, query_string, request_type)
+                for group in groups[1:]
+            ]
+            errors = self.group(groups[0], service, query_string, request_type)
+            for future, group in zip(futures, groups[1:]):
+                if future.cancel():
+                    errors.update(self.group(group, service, query_string, request_type))
+                else:
+                    errors.update(future.result())
+            if len(errors) > 0:
+                self._error(service, errors)
+        self._observe_external(service, start_external)
+        self._observe(service, caller, start)
+        return body
+
+    def group(self, group, caller: str, query_string: str, request_type: Optional[str]) -> dict:
+        # sequential calls of the selected services of a group, returns the errors by service
+        errors = dict()
+        for service in self.call_plan.select_services(group):
+            try:
+                self.call(service.split("__")[0], caller, query_string, request_type)
+            except Exception as err:
+                errors[service] = err
+        return errors
+
+    ### asyncio engine
+
+    async def call_async(
+        self, service: str, caller: str, query_string: str, request_type: Optional[str] = None
+    ):
+        start = time.time()
+        plan = self.plan(service, query_string, request_type)
+        body = await self.internal_service_executor.run_internal_service_async(
+            plan.internal_service, self.pool
+        )
+        self._observe_internal(service, caller, body, start)
+
+        start_external = time.time()
+        if len(plan.external_services) > 0:
+            errors = dict()
+            for group_errors in await asyncio.gather(
+                *(
+                    self.group_async(group, service, query_string, request_type)
+                    for group in plan.external_services
+                )
+            ):
+                errors.update(group_errors)
+            if len(errors) > 0:
+                self._error(service, errors)
+        self._observe_external(service, start_external)
+        self._observe(service, caller, start)
+        return body
+
+    async def group_async(
+        self, group, caller: str, query_string: str, request_type: Optional[str]
+    ) -> dict:
+        errors = dict()
+        for service in self.call_plan.select_services(group):
+            try:
+                await self.call_async(service.split("__")[0], caller, query_string, request_type)
+            except Exception as err:
+                errors[service] = err
+        return errors
+
+    ### load
+
+    def run(self, ingress_service: str, requests: int, concurrency: int, query_string: str,
+            request_type: Optional[str] = None) -> List[tuple]:
+        """
+        Sends `requests` requests to the ingress service from `concurrency` closed-loop clients,
+        returns (start time ms, latency ms, status) per request, like the result file of the Runner.
+        """
+        results = list()
+        lock = threading.Lock()
+        sent = iter(range(requests))
+
+        def next_request() -> bool:
+            with lock:
+                return next(sent, None) is not None
+
+        def client():
+            while next_request():
+                start = time.time()
+                try:
+                    self.call(ingress_service, "", query_string, request_type)
+                    status = 200
+                except Exception as err:
+                    logger.error("Error in request to %s -- %s" % (ingress_service, repr(err)))
+                    status = 500
+                results.append((int(1000 * start), int(1000 * (time.time() - start)), status))
+
+        async def client_async():
+            while next_request():
+                start = time.time()
+                try:
+                    await self.call_async(ingress_service, "", query_string, request_type)
+                    status = 200
+                except Exception as err:
+                    logger.error("Error in request to %s -- %s" % (ingress_service, repr(err)))
+                    status = 500
+                results.append((int(1000 * start), int(1000 * (time.time() - start)), status))
+
+        async def clients_async():
+            await asyncio.gather(*(client_async() for _ in range(concurrency)))
+
+        if self.engine == "asyncio":
+            asyncio.run(clients_async())
+        else:
+            # the clients are not threads of the pool, like the Runner in front of the cells
+            clients = [threading.Thread(target=client) for _ in range(concurrency)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+        return results
+
+    def summary(self) -> Dict[str, dict]:
+        return {service: stats.summary() for service, stats in self.stats.items()}
@@ -0,0 +1,111 @@
+from Monolith import MONOLITH_PATH, Monolith, load_service_cell
+from datetime import datetime
+from prometheus_client import start_http_server
+import json
+import time
+import os
+import jsonmerge
+
+import argparse
+import argcomplete
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('-c', '--config-file', action='store', dest='parameters_file',
+                    help='The Monolith Parameters file', default=f'{MONOLITH_PATH}/MonolithParameters.json')
+
+argcomplete.autocomplete(parser)
+
+try:
+    args = parser.parse_args()
+except ImportError:
+    print("Import error, there are missing dependencies to install.  'apt-get install python3-argcomplete "
+          "&& activate-global-python-argcomplete3' may solve")
+except AttributeError:
+    parser.print_help()
+except Exception as err:
+    print("Error:", err)
+
+parameters_file_path = args.parameters_file
+
+default_params = {
+    "workmodel_path": "SimulationWorkspace/workmodel.json",
+    "internal_service_functions_path": "CustomFunctions",
+    "engine": "threads",
+    "thread_pool_size": 16,
+    "ingress_service": "s0",
+    "workload_events": 100,
+    "concurrency": 4,
+    "query_string": "",
+    "request_type": None,
+    "metrics_port": 0,
+    "result_file": "monolith",
+}
+
+try:
+    with open(parameters_file_path) as f:
+        params = json.load(f)
+    monolith_parameters = jsonmerge.merge(default_params, params["MonolithParameters"])
+    with open(monolith_parameters["workmodel_path"]) as f:
+        work_model = json.load(f)
+    if "OutputPath" in params.keys() and len(params["OutputPath"]) > 0:
+        output_path = params["OutputPath"]
+        if output_path.endswith("/"):
+            output_path = output_path[:-1]
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+    else:
+        output_path = MONOLITH_PATH
+    result_file = monolith_parameters["result_file"]
+
+except Exception as err:
+    print("ERROR: in RunMonolith,", err)
+    exit(1)
+
+call_plan, internal_service_executor = load_service_cell(monolith_parameters["internal_service_functions_path"])
+monolith = Monolith(work_model, monolith_parameters, call_plan, internal_service_executor)
+if monolith_parameters["metrics_port"] > 0:
+    start_http_server(monolith_parameters["metrics_port"])
+
+print("###############################################")
+print("###########   Run Monolith Run!!   ##########")
+print("###############################################")
+print("Engine: %s - Services: %d" % (monolith_parameters["engine"], len(work_model)))
+print("Start Time:", datetime.now().strftime("%H:%M:%S.%f - %g/%m/%Y"))
+start_time = time.time()
+results = monolith.run(
+    monolith_parameters["ingress_service"],
+    monolith_parameters["workload_events"],
+    monolith_parameters["concurrency"],
+    monolith_parameters["query_string"],
+    monolith_parameters["request_type"],
+)
+run_duration_sec = time.time() - start_time
+
+error_requests = len([r for r in results if r[2] != 200])
+print(
+    "Run Duration (sec): %.6f" % run_duration_sec,
+    "Total Requests: %d - Error Request: %d - Average Latency (ms): %.6f - Request rate (req/sec) %.6f"
+    % (
+        len(results),
+        error_requests,
+        sum(r[1] for r in results) / max(1, len(results)),
+        len(results) / run_duration_sec,
+    ),
+)
+
+summary = monolith.summary()
+for service, service_summary in summary.items():
+    request = service_summary["request"]
+    if request["count"] > 0:
+        print(
+            "%s - Requests: %d - Errors: %d - Mean (ms): %.3f - p50 (ms): %.3f - p95 (ms): %.3f - p99 (ms): %.3f"
+            % (service, request["count"], service_summary["errors"], request["mean_ms"],
+               request["p50_ms"], request["p95_ms"], request["p99_ms"])
+        )
+
+# the same columns of the Runner result file, without processed and pending requests
+with open(f"{output_path}/{result_file}.txt", "w") as f:
+    f.writelines("\n".join("%d \t %d \t %d" % result for result in results))
+with open(f"{output_path}/{result_file}.json", "w") as f:
+    f.write(json.dumps({"run_duration_sec": run_duration_sec, "services": summary}, indent=2))
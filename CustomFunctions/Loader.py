@@ -1,75 +1,319 @@
+import asyncio
+import atexit
 import logging
+import mmap
 import random
 import time
 import os
-from concurrent.futures import ThreadPoolExecutor, wait
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 import jsonmerge
 import string
+import json
+import threading
 import datetime
+import math
+import struct
+import fcntl
+import itertools
+from prometheus_client import Gauge, Summary
+
+# The payloads are slices of the arena of the service cell, generated once in the gunicorn master.
+# Outside of the cell (e.g., `python Loader.py`), it is imported from the ServiceCell directory.
+try:
+    from PayloadArena import get_payload
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ServiceCell"))
+    from PayloadArena import get_payload
+
+import numpy as np
 
 LOGLEVEL = os.environ.get("LOGLEVEL", "INFO").upper()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-params_processed = False
+# Parameters merged with the defaults, by id of the parameters of the internal service.
+# The caches by id are cleared when they reach MAX_CACHED_PARAMS entries, so that they do not keep
+# the parameters of the previous work models after hot reloads, or those unpickled at each call
+# by the process executor.
+MAX_CACHED_PARAMS = 256
+_merged_params = dict()
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+# Distributions that numeric loader parameters can be sampled from, and size of the prefilled buffers.
+DISTRIBUTIONS = ("uniform", "exponential", "lognormal", "pareto", "bimodal", "empirical")
+DISTRIBUTION_BUFFER_SIZE = 4096
+
+# Samplers of the distributions in the parameters, by id of the specification, created in each worker process.
+_samplers = dict()
+
+# Complexities timed by the CPU calibration, and resulting table complexity -> ms.
+CPU_CALIBRATION_COMPLEXITIES = (10, 25, 50, 100, 250, 500, 1000, 2000)
+_cpu_calibration = None
+
+CPU_CALIBRATION_MS = Gauge(
+    "mub_cpu_calibration_ms",
+    "CPU time of the pi computation of the loader, by complexity",
+    ["zone", "app_name", "complexity"],
+    multiprocess_mode="max",
+)
+
+# Access patterns of the memory loader, "legacy" allocates Python strings at each request.
+MEMORY_ACCESS_PATTERNS = ("legacy", "sequential", "random", "strided", "pointer_chasing")
+CACHE_LINE_SIZE = 64
+MEMORY_CHUNK_SIZE = 64 * 1024
+
+# Preallocated buffers of the memory loader, by size and chaining, created in each worker process.
+_memory_buffers = dict()
+_memory_buffers_lock = threading.Lock()
+
+# I/O modes of the disk loader, "legacy" creates, writes, reads and deletes a file at each request.
+DISK_IO_MODES = ("legacy", "buffered", "direct", "mmap")
+DISK_SYNC_POLICIES = ("none", "request", "write")
+DISK_ALIGNMENT = 4096  # O_DIRECT and mmap offsets and sizes are multiple of the page size
+DISK_WRITE_BUFFERS = 8
+
+# Preallocated file pools of the disk loader, by file name and configuration, created in each worker process.
+_disk_pools = dict()
+_disk_pools_lock = threading.Lock()
+_disk_pool_ids = itertools.count()
+
+# Scopes of the resources of the contention loader: one per thread, per worker process or per pod.
+CONTENTION_SCOPES = ("thread", "process", "pod")
+# Bounds of the backoff between two attempts to take a "pod" slot when all of them are busy (s).
+POD_SLOT_MIN_BACKOFF = 0.0005
+POD_SLOT_MAX_BACKOFF = 0.01
+
+# Semaphores of the contention loader, by resource name, for the "thread" and "process" scopes.
+_contention_semaphores = dict()
+_contention_local = threading.local()
+
+CONTENTION_WAIT = Summary(
+    "mub_contention_wait_seconds",
+    "Time waited to acquire a slot of a resource of the contention loader",
+    ["zone", "app_name", "scope", "resource"],
+)
+
+
+# Persistent pools of the CPU loader, by executor type and size, created in each worker process.
+_cpu_pools = dict()
+_cpu_pools_lock = threading.Lock()
+
+
+def _read_empirical_distribution(path):
+    # one sample per line, or "value,cdf" lines of an empirical CDF
+    values, cdf = list(), list()
+    with open(path) as f:
+        for line in f:
+            fields = line.replace(",", " ").split()
+            if len(fields) == 0 or fields[0].startswith("#"):
+                continue
+            values.append(float(fields[0]))
+            if len(fields) > 1:
+                cdf.append(float(fields[1]))
+    if len(values) == 0:
+        raise ValueError(f"Empty empirical distribution: {path}")
+    return values, (cdf if len(cdf) == len(values) else None)
+
+
+def _draw(spec, size):
+    # size samples of the distribution spec, as a list
+    distribution = spec["distribution"]
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unsupported distribution: {distribution}")
+    if distribution == "bimodal":
+        # the "low" mode with probability p, else the "high" one; modes are numbers or specs
+        low, high = (_draw(m, size) if isinstance(m, dict) else [m] * size for m in (spec["low"], spec["high"]))
+        p = float(spec.get("p", 0.5))
+        return [l if random.random() < p else h for l, h in zip(low, high)]
+    if distribution == "empirical":
+        values, cdf = _read_empirical_distribution(spec["file"])
+        if cdf is None:
+            # bootstrap of the samples
+            return random.choices(values, k=size)
+        points = sorted(zip(cdf, values))
+        cdf, values = [c for c, _ in points], [v for _, v in points]
+        return np.interp(np.random.random(size), cdf, values).tolist()
+    if distribution == "uniform":
+        return np.random.uniform(spec["min"], spec["max"], size).tolist()
+    if distribution == "exponential":
+        return np.random.exponential(spec["mean"], size).tolist()
+    if distribution == "lognormal":
+        return np.random.lognormal(spec["mu"], spec["sigma"], size).tolist()
+    return ((np.random.pareto(spec["alpha"], size) + 1) * spec.get("scale", 1)).tolist()
+
+
+class _Sampler:
+    """Samples of a distribution drawn from a buffer that is refilled all at once."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.lower = float(spec.get("clip", [-math.inf, math.inf])[0])
+        self.upper = float(spec.get("clip", [-math.inf, math.inf])[1])
+        self.samples = list()
+        self.lock = threading.Lock()
+
+    def sample(self):
+        with self.lock:
+            if len(self.samples) == 0:
+                self.samples = _draw(self.spec, DISTRIBUTION_BUFFER_SIZE)
+            value = self.samples.pop()
+        return min(max(value, self.lower), self.upper)
+
+
+def _cache(cache, key, value):
+    if len(cache) >= MAX_CACHED_PARAMS:
+        cache.clear()
+    cache[key] = value
+
+
+def _sample(value):
+    # numeric parameters can be a distribution spec, e.g. {"distribution": "lognormal", "mu": 0, "sigma": 1}
+    if not isinstance(value, dict):
+        return value
+    # the specs are those of the merged parameters, cached per internal service, so the
+    # sampler is found by the identity of the spec instead of its content
+    spec, sampler, pid = _samplers.get(id(value), (None, None, None))
+    if spec is not value or pid != os.getpid():
+        sampler = _Sampler(value)
+        _cache(_samplers, id(value), (value, sampler, os.getpid()))
+    return sampler.sample()
+
+
+def _compute_pi_digits(cpu_load):
+    # spigot algorithm computing cpu_load + 1 digits of pi
+    pi_greco = list()
+    q, r, t, k, m, x = 1, 0, 1, 1, 3, 3
+    counter = 0
+    while True:
+        if 4 * q + r - t < m * t:
+            # yield m
+            pi_greco.append(str(m))
+            q, r, t, k, m, x = (
+                10 * q,
+                10 * (r - m * t),
+                t,
+                k,
+                (10 * (3 * q + r)) // t - 10 * m,
+                x,
+            )
+            if counter > cpu_load - 1:
+                break
+            else:
+                counter = counter + 1
+        else:
+            q, r, t, k, m, x = (
+                q * k,
+                (2 * q + r) * x,
+                t * x,
+                k + 1,
+                (q * (7 * k + 2) + r * x) // (t * x),
+                x + 2,
+            )
+    # print("Service complexity: %d - Number of cycles for pi computation: %d" % (cpu_load, cpu_load + 1))
+    # print(f"Value: 3.{''.join(pi_greco[1:])}\n")
+    return pi_greco
+
+
+def calibrate_cpu(complexities=CPU_CALIBRATION_COMPLEXITIES, repetitions=3):
+    """
+    Times the pi computation for the given complexities on this pod
+    and returns the table complexity -> milliseconds of CPU time.
+    """
+    global _cpu_calibration
+    table = dict()
+    for complexity in complexities:
+        samples = list()
+        for _ in range(repetitions):
+            start = time.process_time()
+            _compute_pi_digits(complexity)
+            samples.append((time.process_time() - start) * 1000)
+        table[complexity] = max(min(samples), 1e-3)
+        CPU_CALIBRATION_MS.labels(ZONE, K8S_APP, str(complexity)).set(table[complexity])
+    _cpu_calibration = table
+    logger.info("CPU calibration (complexity -> ms): {table}".format(table=table))
+    return table
+
+
+def get_cpu_calibration():
+    if _cpu_calibration is None:
+        calibrate_cpu()
+    return _cpu_calibration
+
+
+def _complexity_for_ms(cpu_time_ms):
+    # piecewise log-log interpolation of the calibration table, extrapolated with the closest segment
+    points = sorted(get_cpu_calibration().items())
+    if cpu_time_ms <= 0:
+        return 0
+    log_ms = math.log(cpu_time_ms)
+    segments = list(zip(points, points[1:]))
+    (c0, ms0), (c1, ms1) = segments[0] if log_ms < math.log(points[0][1]) else segments[-1]
+    for (lc0, lms0), (lc1, lms1) in segments:
+        if lms0 <= cpu_time_ms <= lms1:
+            (c0, ms0), (c1, ms1) = (lc0, lms0), (lc1, lms1)
+            break
+    if ms1 <= ms0:
+        return int(c1)
+    slope = (math.log(c1) - math.log(c0)) / (math.log(ms1) - math.log(ms0))
+    return max(1, int(round(math.exp(math.log(c0) + slope * (log_ms - math.log(ms0))))))
 
 
 def cpu_loader_job(params):
-    cpu_load = random.randint(
-        params["range_complexity"][0], params["range_complexity"][1]
-    )
+    # cpu_time_ms (number or [min, max]) replaces range_complexity using the calibration table
+    if "cpu_time_ms" in params:
+        cpu_time_ms = params["cpu_time_ms"]
+        if isinstance(cpu_time_ms, list):
+            cpu_time_ms = random.uniform(cpu_time_ms[0], cpu_time_ms[1])
+        cpu_load = _complexity_for_ms(float(_sample(cpu_time_ms)))
+    elif isinstance(params["range_complexity"], dict):
+        cpu_load = max(1, int(_sample(params["range_complexity"])))
+    else:
+        cpu_load = random.randint(
+            params["range_complexity"][0], params["range_complexity"][1]
+        )
     trials = int(params["trials"])
 
     logger.info(
-        "Running CPU loader job with {trials} trials and complexity [{cmin}, {cmax}]".format(
-            trials=trials,
-            cmin=params["range_complexity"][0],
-            cmax=params["range_complexity"][1],
+        "Running CPU loader job with {trials} trials and complexity {cpu_load}".format(
+            trials=trials, cpu_load=cpu_load
         )
     )
 
     start = datetime.datetime.now()
     for x in range(trials):
-        pi_greco = list()
-        q, r, t, k, m, x = 1, 0, 1, 1, 3, 3
-        counter = 0
-        while True:
-            if 4 * q + r - t < m * t:
-                # yield m
-                pi_greco.append(str(m))
-                q, r, t, k, m, x = (
-                    10 * q,
-                    10 * (r - m * t),
-                    t,
-                    k,
-                    (10 * (3 * q + r)) // t - 10 * m,
-                    x,
-                )
-                if counter > cpu_load - 1:
-                    break
-                else:
-                    counter = counter + 1
-            else:
-                q, r, t, k, m, x = (
-                    q * k,
-                    (2 * q + r) * x,
-                    t * x,
-                    k + 1,
-                    (q * (7 * k + 2) + r * x) // (t * x),
-                    x + 2,
-                )
-        # print("Service complexity: %d - Number of cycles for pi computation: %d" % (cpu_load, cpu_load + 1))
-        # print(f"Value: 3.{''.join(pi_greco[1:])}\n")
+        _compute_pi_digits(cpu_load)
 
     end = datetime.datetime.now()
     delta = end - start
     logger.info("Spend {sec} seconds.".format(sec=delta.total_seconds()))
 
 
+def _get_cpu_pool(executor, pool_size):
+    # A pool is reused by all the requests of a worker process with the same pool size; pools
+    # are never replaced, so a request cannot shut down the pool used by another one.
+    with _cpu_pools_lock:
+        pool, pid = _cpu_pools.get((executor, pool_size), (None, None))
+        if pool is None or pid != os.getpid():
+            if executor == "process":
+                pool = ProcessPoolExecutor(pool_size)
+                # warm up, so that the first request does not pay for the process creation
+                wait([pool.submit(time.sleep, 0) for _ in range(pool_size)])
+            elif executor == "thread":
+                pool = ThreadPoolExecutor(pool_size)
+            else:
+                raise ValueError(f"Unsupported CPU stress executor: {executor}")
+            _cpu_pools[(executor, pool_size)] = (pool, os.getpid())
+        return pool
+
+
 def cpu_loader(params):
     # print("--------> CPU stress start")
+    # "thread" jobs are serialized by the GIL, "process" jobs run on as many cores as thread_pool_size
     pool_size = int(params["thread_pool_size"])
-    pool = ThreadPoolExecutor(pool_size)
+    pool = _get_cpu_pool(params.get("executor", "thread"), pool_size)
     futures = list()
     for thread_idx in range(pool_size):
         futures.append(pool.submit(cpu_loader_job, params))
@@ -82,19 +326,20 @@ def bandwidth_loader(params):
     # print("--------> Network stress start")
     # TODO: return the data of the made requests?
     mean_bandwidth = params['mean_bandwidth'] if 'mean_bandwidth' in params else 1
-    bandwidth_load = random.expovariate(1 / mean_bandwidth)
+    if isinstance(mean_bandwidth, dict):
+        # the response size in kB follows the given distribution
+        bandwidth_load = _sample(mean_bandwidth)
+    else:
+        bandwidth_load = random.expovariate(1 / mean_bandwidth)
     num_chars = int(max(1, 1000 * bandwidth_load))  # Response in kB
-    response_body = "".join(
-        random.choice(string.ascii_letters) for i in range(num_chars)
-    )
+    response_body = get_payload(num_chars)
     # print("--------> Network stress stop")
     return response_body
 
 
-def memory_loader(params):
-    # print("--------> Memory stress start")
+def _legacy_memory_loader(params):
     memory_size = params["memory_size"]
-    memory_io = params["memory_io"]
+    memory_io = _sample(params["memory_io"])
 
     # allocate memory_size kB of memory
     dummy_buffer = []
@@ -103,17 +348,99 @@ def memory_loader(params):
     for i in range(0, int(memory_io)):
         v = dummy_buffer[i % int(memory_size)]  # read operation
         dummy_buffer[i % int(memory_size)] = ["A" * 1000]  # write operation
-    # print("--------> Memory stress stop")
     return dummy_buffer
 
 
-def disk_loader(params):
-    # print("--------> Disk stress start")
+def _get_memory_buffer(size, pointer_chasing):
+    # The buffer is reused by all the requests of a worker process, so that RSS stays constant.
+    # For pointer chasing, the first 4 bytes of each cache line hold the index of the next line
+    # of a random cycle over all the lines, so every load depends on the previous one. The other
+    # patterns write in place, so chained buffers are not shared with them.
+    with _memory_buffers_lock:
+        buffer, pid = _memory_buffers.get((size, pointer_chasing), (None, None))
+        if buffer is None or pid != os.getpid():
+            buffer = bytearray(size)
+            if pointer_chasing:
+                lines = size // CACHE_LINE_SIZE
+                order = list(range(lines))
+                random.shuffle(order)
+                for i in range(lines):
+                    struct.pack_into("=I", buffer, order[i] * CACHE_LINE_SIZE, order[(i + 1) % lines])
+            _memory_buffers[(size, pointer_chasing)] = (buffer, os.getpid())
+        return buffer
+
+
+def _touch_sequential(buffer, bytes_touched):
+    size = len(buffer)
+    view = np.frombuffer(buffer, dtype=np.uint8)
+    offset = 0
+    while bytes_touched > 0:
+        length = min(MEMORY_CHUNK_SIZE, bytes_touched, size - offset)
+        view[offset:offset + length] += 1  # read and write in place
+        bytes_touched -= length
+        offset = (offset + length) % size
+
+
+def _touch_random(buffer, accesses):
+    lines = len(buffer) // CACHE_LINE_SIZE
+    view = np.frombuffer(buffer, dtype=np.uint8)
+    view[np.random.randint(0, lines, accesses) * CACHE_LINE_SIZE] += 1
+
+
+def _touch_strided(buffer, accesses, stride):
+    size = len(buffer)
+    view = np.frombuffer(buffer, dtype=np.uint8)
+    start = 0
+    while accesses > 0:
+        count = min(accesses, (size - start + stride - 1) // stride)
+        end = start + (count - 1) * stride + 1
+        view[start:end:stride] += 1
+        accesses -= count
+        start = (start + 1) % stride
+
+
+def _touch_pointer_chasing(buffer, accesses):
+    # dependent loads, which cannot be vectorized nor prefetched
+    pointers = memoryview(buffer).cast("I")
+    step = CACHE_LINE_SIZE // pointers.itemsize
+    line = 0
+    for _ in range(accesses):
+        line = pointers[line * step]
+    return line
+
+
+def memory_loader(params):
+    # print("--------> Memory stress start")
+    # access_pattern (default "legacy") selects the stress, the other patterns touch
+    # bytes_touched bytes of a preallocated working set of memory_size kB
+    access_pattern = params.get("access_pattern", "legacy")
+    if access_pattern == "legacy":
+        return _legacy_memory_loader(params)
+    if access_pattern not in MEMORY_ACCESS_PATTERNS:
+        raise ValueError(f"Unsupported memory access pattern: {access_pattern}")
+
+    size = max(CACHE_LINE_SIZE, int(params["memory_size"]) * 1024 // CACHE_LINE_SIZE * CACHE_LINE_SIZE)
+    bytes_touched = int(_sample(params.get("bytes_touched", size)))
+    buffer = _get_memory_buffer(size, access_pattern == "pointer_chasing")
+    accesses = max(1, bytes_touched // CACHE_LINE_SIZE)
+    if access_pattern == "sequential":
+        _touch_sequential(buffer, bytes_touched)
+    elif access_pattern == "random":
+        _touch_random(buffer, accesses)
+    elif access_pattern == "strided":
+        _touch_strided(buffer, accesses, max(1, int(params.get("stride", CACHE_LINE_SIZE))))
+    else:
+        _touch_pointer_chasing(buffer, accesses)
+    # print("--------> Memory stress stop")
+    return
+
+
+def _legacy_disk_loader(params):
     # print("--------> Write stress start")
     filename_base = params["tmp_file_name"]
     rnd_str = "".join(random.choice(string.ascii_lowercase) for i in range(10))
     filename = f"{rnd_str}-{filename_base}"
-    blocks_count = params["disk_write_block_count"]
+    blocks_count = int(_sample(params["disk_write_block_count"]))
     block_size = params["disk_write_block_size"]
     f = os.open(filename, os.O_CREAT | os.O_WRONLY, 0o777)  # low-level I/O
     for i in range(blocks_count):
@@ -140,48 +467,329 @@ def disk_loader(params):
     return
 
 
+def _aligned_buffer(size, data=None):
+    # anonymous mmaps are page aligned, as required by O_DIRECT
+    buffer = mmap.mmap(-1, size)
+    if data is not None:
+        buffer[:] = data
+    return buffer
+
+
+class _DiskFilePool:
+    """Files of a worker process that are created once and reused by the disk loader."""
+
+    def __init__(self, path_prefix, files, file_size, block_size, io_mode, queue_depth):
+        self.block_size = block_size
+        self.blocks = max(1, file_size // block_size)
+        self.io_mode = io_mode
+        self.write_buffers = [
+            _aligned_buffer(block_size, os.urandom(block_size)) for _ in range(DISK_WRITE_BUFFERS)
+        ]
+        self.read_buffers = [_aligned_buffer(block_size) for _ in range(queue_depth)]
+        self.paths, self.fds, self.maps = list(), list(), list()
+        for i in range(files):
+            path = f"{path_prefix}.{os.getpid()}.{i}"
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+            for block in range(self.blocks):
+                os.pwrite(fd, self.write_buffers[block % DISK_WRITE_BUFFERS], block * block_size)
+            os.fsync(fd)
+            if io_mode == "direct":
+                fd = self._reopen_direct(path, fd)
+            self.paths.append(path)
+            self.fds.append(fd)
+            if io_mode == "mmap":
+                self.maps.append(mmap.mmap(fd, self.blocks * block_size))
+        self.executor = ThreadPoolExecutor(queue_depth) if queue_depth > 1 else None
+        atexit.register(self.close)
+
+    @staticmethod
+    def _reopen_direct(path, fd):
+        try:
+            direct_fd = os.open(path, os.O_RDWR | getattr(os, "O_DIRECT", 0))
+        except OSError as err:
+            # e.g., tmpfs does not support O_DIRECT
+            logger.warning("O_DIRECT not supported for %s, using buffered I/O: %s", path, err)
+            return fd
+        os.close(fd)
+        return direct_fd
+
+    def _sync(self, file_idx, offset=None):
+        if self.io_mode == "mmap":
+            if offset is None:
+                self.maps[file_idx].flush()
+            else:
+                self.maps[file_idx].flush(offset, self.block_size)
+        else:
+            os.fsync(self.fds[file_idx])
+
+    def _io_job(self, slot, io_count, read_ratio, sync):
+        read_buffer = self.read_buffers[slot]
+        written = set()
+        for _ in range(io_count):
+            file_idx = random.randrange(len(self.fds))
+            offset = random.randrange(self.blocks) * self.block_size
+            if random.random() < read_ratio:
+                if self.io_mode == "mmap":
+                    read_buffer[:] = self.maps[file_idx][offset : offset + self.block_size]
+                else:
+                    os.preadv(self.fds[file_idx], [read_buffer], offset)
+            else:
+                write_buffer = self.write_buffers[random.randrange(DISK_WRITE_BUFFERS)]
+                if self.io_mode == "mmap":
+                    self.maps[file_idx][offset : offset + self.block_size] = write_buffer
+                else:
+                    os.pwrite(self.fds[file_idx], write_buffer, offset)
+                if sync == "write":
+                    self._sync(file_idx, offset)
+                written.add(file_idx)
+        return written
+
+    def run(self, io_count, read_ratio, sync):
+        # io_count operations split among queue_depth concurrent jobs
+        queue_depth = len(self.read_buffers)
+        counts = [io_count // queue_depth + (1 if i < io_count % queue_depth else 0) for i in range(queue_depth)]
+        if self.executor is None:
+            written = self._io_job(0, io_count, read_ratio, sync)
+        else:
+            futures = [self.executor.submit(self._io_job, i, c, read_ratio, sync) for i, c in enumerate(counts) if c > 0]
+            written = set().union(*[f.result() for f in futures])
+        if sync == "request":
+            for file_idx in written:
+                self._sync(file_idx)
+
+    def close(self):
+        for m in self.maps:
+            m.close()
+        for fd, path in zip(self.fds, self.paths):
+            os.close(fd)
+            if os.path.exists(path):
+                os.remove(path)
+        self.maps, self.fds, self.paths = list(), list(), list()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+def _get_disk_pool(params, io_mode):
+    block_size = int(params["disk_write_block_size"])
+    if io_mode in ("direct", "mmap"):
+        block_size = -(-block_size // DISK_ALIGNMENT) * DISK_ALIGNMENT
+    if "file_size" in params:
+        file_size = int(float(params["file_size"]) * 1024)  # kB
+    else:
+        file_size = int(params["disk_write_block_count"]) * block_size
+    config = (
+        max(1, int(params.get("files", 1))),
+        max(block_size, file_size),
+        block_size,
+        io_mode,
+        max(1, int(params.get("queue_depth", 1))),
+    )
+    # internal services with different configurations get their own pools, which are never
+    # closed while the worker runs, so a pool cannot be closed under the I/O of another request
+    key = (params["tmp_file_name"], config)
+    with _disk_pools_lock:
+        pool, pid = _disk_pools.get(key, (None, None))
+        if pool is None or pid != os.getpid():
+            # the files of each configuration have their own name
+            path_prefix = f"{params['tmp_file_name']}.{next(_disk_pool_ids)}"
+            pool = _DiskFilePool(path_prefix, *config)
+            _disk_pools[key] = (pool, os.getpid())
+        return pool
+
+
+def disk_loader(params):
+    # print("--------> Disk stress start")
+    # io_mode (default "legacy") selects the stress, the other modes run io_count reads/writes
+    # of disk_write_block_size bytes on a pool of preallocated files
+    io_mode = params.get("io_mode", "legacy")
+    if io_mode == "legacy":
+        return _legacy_disk_loader(params)
+    if io_mode not in DISK_IO_MODES:
+        raise ValueError(f"Unsupported disk I/O mode: {io_mode}")
+    sync = params.get("sync", "request")
+    if sync not in DISK_SYNC_POLICIES:
+        raise ValueError(f"Unsupported disk sync policy: {sync}")
+    pool = _get_disk_pool(params, io_mode)
+    io_count = int(_sample(params.get("io_count", 2 * int(params["disk_write_block_count"]))))
+    pool.run(io_count, float(params.get("read_ratio", 0.5)), sync)
+    # print("--------> Disk stress stop")
+    return
+
+
+def _get_semaphore(scope, resource, slots):
+    if scope == "thread":
+        semaphores = _contention_local.__dict__.setdefault("semaphores", dict())
+    else:
+        semaphores = _contention_semaphores
+    semaphore, pid, size = semaphores.get(resource, (None, None, 0))
+    if semaphore is None or pid != os.getpid() or size != slots:
+        semaphore = threading.BoundedSemaphore(slots)
+        semaphores[resource] = (semaphore, os.getpid(), slots)
+    return semaphore
+
+
+def _acquire_pod_slot(resource, slots):
+    # One lock file per slot in shared memory. A new file descriptor is opened at each acquisition,
+    # as flock locks are shared by the threads using the same open file.
+    shm_dir = os.environ.get("MUB_SHM_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp")
+    paths = [os.path.join(shm_dir, f"mub-contention-{resource}-{slot}") for slot in range(slots)]
+    # while every slot is busy, the slots are tried again after a jittered exponential backoff,
+    # so that the first slot released is taken instead of waiting on a given one
+    backoff = POD_SLOT_MIN_BACKOFF
+    while True:
+        random.shuffle(paths)
+        for path in paths:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        time.sleep(random.uniform(0, backoff))
+        backoff = min(2 * backoff, POD_SLOT_MAX_BACKOFF)
+
+
+def _hold(params):
+    hold_time = float(_sample(params["hold_time"]))
+    if params["hold"] == "busy":
+        end = time.perf_counter() + hold_time
+        while time.perf_counter() < end:
+            pass
+    else:
+        time.sleep(hold_time)
+
+
+def contention_loader(params):
+    # print("--------> Contention stress start")
+    # critical_sections times, hold a slot of a resource with slots slots for hold_time seconds
+    scope = params["scope"]
+    if scope not in CONTENTION_SCOPES:
+        raise ValueError(f"Unsupported contention scope: {scope}")
+    resource = params["resource"]
+    slots = max(1, int(params["slots"]))
+    for _ in range(int(_sample(params["critical_sections"]))):
+        start = time.perf_counter()
+        if scope == "pod":
+            fd = _acquire_pod_slot(resource, slots)
+            CONTENTION_WAIT.labels(ZONE, K8S_APP, scope, resource).observe(time.perf_counter() - start)
+            try:
+                _hold(params)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        else:
+            with _get_semaphore(scope, resource, slots):
+                CONTENTION_WAIT.labels(ZONE, K8S_APP, scope, resource).observe(time.perf_counter() - start)
+                _hold(params)
+    # print("--------> Contention stress stop")
+    return
+
+
 def sleep_loader(params):
     # print("--------> Sleep start")
-    time.sleep(float(params["sleep_time"]))
+    time.sleep(float(_sample(params["sleep_time"])))
     # print("--------> Sleep stop")
     return
 
 
-def loader(params):
-    global params_processed
+def _overwrite_schema(default_params):
+    # numeric defaults are overwritten, also by distribution specs, instead of being merged
+    if isinstance(default_params, dict):
+        return {"properties": {k: _overwrite_schema(v) for k, v in default_params.items()}}
+    return {"mergeStrategy": "overwrite"}
+
 
-    if not params_processed:
+def _get_loader_params(params):
+    # The defaults of the components in the parameters are merged once per internal service
+    # (e.g., per request type). Components that are not in the parameters keep the steady state of
+    # the original loader, which merged the defaults only into the first parameters of the process:
+    # no sleep without sleep_stress and a mean bandwidth of 1 kB without mean_bandwidth.
+    original, merged = _merged_params.get(id(params), (None, None))
+    if original is not params:
         default_params = {
             "cpu_stress": {
                 "run": False,
                 "range_complexity": [100, 100],
                 "thread_pool_size": 1,
                 "trials": 1,
+                "executor": "thread",
+            },
+            "memory_stress": {
+                "run": False,
+                "memory_size": 10000,
+                "memory_io": 1000,
+                "access_pattern": "legacy",
             },
-            "memory_stress": {"run": False, "memory_size": 10000, "memory_io": 1000},
             "disk_stress": {
                 "run": False,
                 "tmp_file_name": "mubtestfile.txt",
                 "disk_write_block_count": 1000,
                 "disk_write_block_size": 1024,
+                "io_mode": "legacy",
+            },
+            "contention_stress": {
+                "run": False,
+                "scope": "process",
+                "resource": "default",
+                "slots": 1,
+                "hold_time": 0.005,
+                "hold": "sleep",
+                "critical_sections": 1,
             },
             "sleep_stress": {"run": True, "sleep_time": 0.01},
             "mean_bandwidth": 11,
         }
 
-        params = jsonmerge.merge(default_params, params)
-        params_processed = True
+        default_params = {key: value for key, value in default_params.items() if key in params}
+        merged = jsonmerge.merge(default_params, params, _overwrite_schema(default_params))
+        _cache(_merged_params, id(params), (params, merged))
+    return merged
+
 
+def _run_blocking_loaders(params):
     if "cpu_stress" in params and params["cpu_stress"]["run"]:
         cpu_loader(params["cpu_stress"])
     if "memory_stress" in params and params["memory_stress"]["run"]:
         memory_loader(params["memory_stress"])
     if "disk_stress" in params and params["disk_stress"]["run"]:
         disk_loader(params["disk_stress"])
+    if "contention_stress" in params and params["contention_stress"]["run"]:
+        contention_loader(params["contention_stress"])
+
+
+def loader_prepare(params):
+    # called by the service-cell at startup, before gunicorn forks the workers
+    cpu_stress = params.get("cpu_stress", dict())
+    if cpu_stress.get("run", False) and "cpu_time_ms" in cpu_stress:
+        get_cpu_calibration()
+
+
+def loader_worker_init(params):
+    # called by each worker of the service-cell after the fork, before its first request
+    params = _get_loader_params(params)
+    cpu_stress = params.get("cpu_stress", dict())
+    if cpu_stress.get("run", False):
+        _get_cpu_pool(cpu_stress.get("executor", "thread"), int(cpu_stress["thread_pool_size"]))
+
+
+def loader(params):
+    params = _get_loader_params(params)
+    _run_blocking_loaders(params)
     if "sleep_stress" in params and params["sleep_stress"]["run"]:
         sleep_loader(params["sleep_stress"])
     return bandwidth_loader(params)
 
 
+async def loader_async(params, executor=None):
+    # Used by the asyncio engine: the CPU, memory and disk loaders run on the executor,
+    # while the sleep only suspends the current request.
+    params = _get_loader_params(params)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, _run_blocking_loaders, params)
+    if "sleep_stress" in params and params["sleep_stress"]["run"]:
+        await asyncio.sleep(float(_sample(params["sleep_stress"]["sleep_time"])))
+    return await loop.run_in_executor(executor, bandwidth_loader, params)
+
+
 if __name__ == "__main__":
     loader({})
@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import csv
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+import time
+
+import jsonmerge
+
+# The payloads are slices of the arena of the service cell, generated once in the gunicorn master.
+# Outside of the cell (e.g., `python TraceReplay.py`), it is imported from the ServiceCell directory.
+try:
+    from PayloadArena import get_payload
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ServiceCell"))
+    from PayloadArena import get_payload
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Binary dataset: header, index of the services, then (service time ms, response size kB) records.
+TRACE_MAGIC = b"MUBTRACE"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("<8sII")  # magic, version, number of services
+TRACE_INDEX_ENTRY = struct.Struct("<64sQQ")  # service id, offset of its records, number of records
+TRACE_RECORD = struct.Struct("<ff")  # service time ms, response size kB
+
+# Datasets mapped in memory and sequential cursors shared by the workers of the cell, by path.
+_datasets = dict()
+_cursors = dict()
+_lock = threading.Lock()
+
+# Parameters merged with the defaults, by id of the parameters of the internal service,
+# cleared when full so that the parameters of previous work models (hot reload) are not kept.
+MAX_CACHED_PARAMS = 256
+_merged_params = dict()
+
+
+def build_dataset(samples: dict, path: str):
+    """Writes the dataset of samples {service id: [(service time ms, response size kB), ...]}."""
+    services = sorted(samples)
+    offset = TRACE_HEADER.size + TRACE_INDEX_ENTRY.size * len(services)
+    with open(path, "wb") as f:
+        f.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(services)))
+        for service in services:
+            f.write(TRACE_INDEX_ENTRY.pack(service.encode(), offset, len(samples[service])))
+            offset += TRACE_RECORD.size * len(samples[service])
+        for service in services:
+            for service_time, response_size in samples[service]:
+                f.write(TRACE_RECORD.pack(service_time, response_size))
+
+
+def _load_dataset(path):
+    # the file is mapped once per worker process, its pages are shared through the page cache
+    dataset, pid = _datasets.get(path, (None, None))
+    if dataset is not None and pid == os.getpid():
+        return dataset
+    with _lock:
+        # the first requests of the threads of a worker map it only once
+        dataset, pid = _datasets.get(path, (None, None))
+        if dataset is None or pid != os.getpid():
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, services = TRACE_HEADER.unpack_from(data, 0)
+            if magic != TRACE_MAGIC or version != TRACE_VERSION:
+                data.close()
+                raise ValueError(f"Not a trace-replay dataset: {path}")
+            index = dict()
+            for i in range(services):
+                service, offset, count = TRACE_INDEX_ENTRY.unpack_from(
+                    data, TRACE_HEADER.size + i * TRACE_INDEX_ENTRY.size
+                )
+                index[service.rstrip(b"\0").decode()] = (offset, count)
+            dataset = (data, index)
+            _datasets[path] = (dataset, os.getpid())
+    return dataset
+
+
+def _cursor_file(path, service):
+    # 8-byte counter in shared memory, one per dataset and service
+    shm_dir = os.environ.get("MUB_SHM_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp")
+    digest = hashlib.sha1(f"{os.path.abspath(path)}:{service}".encode()).hexdigest()[:16]
+    cursor_path = os.path.join(shm_dir, f"mub-trace-cursor-{digest}")
+    cursor = _cursors.get(cursor_path)
+    if cursor is not None and cursor[1] == os.getpid():
+        return cursor
+    with _lock:
+        cursor = _cursors.get(cursor_path)
+        if cursor is None or cursor[1] != os.getpid():
+            fd = os.open(cursor_path, os.O_CREAT | os.O_RDWR, 0o644)
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            cursor = (fd, os.getpid(), mmap.mmap(fd, 8))
+            _cursors[cursor_path] = cursor
+    return cursor
+
+
+def _next_sequential(path, service, count):
+    # the cursor is incremented under a file lock, so the workers replay the records in order
+    fd, _, counter = _cursor_file(path, service)
+    with _lock:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            position = struct.unpack_from("<Q", counter, 0)[0]
+            struct.pack_into("<Q", counter, 0, position + 1)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    return position % count
+
+
+def _next_record(params):
+    data, index = _load_dataset(params["file"])
+    service = params["service"] or os.environ.get("APP", "")
+    if service not in index:
+        raise KeyError(f"Service {service} not in the trace-replay dataset {params['file']}")
+    offset, count = index[service]
+    if params["cursor"] == "sequential":
+        position = _next_sequential(params["file"], service, count)
+    elif params["cursor"] == "random":
+        position = random.randrange(count)
+    else:
+        raise ValueError(f"Unsupported trace-replay cursor: {params['cursor']}")
+    service_time, response_size = TRACE_RECORD.unpack_from(data, offset + position * TRACE_RECORD.size)
+    return service_time * float(params["time_scale"]) / 1000, response_size
+
+
+def _get_params(params):
+    original, merged = _merged_params.get(id(params), (None, None))
+    if original is not params:
+        default_params = {
+            "file": "MSConfig/InternalServiceFunctions/trace.bin",
+            "service": None,
+            "cursor": "sequential",
+            "mode": "sleep",
+            "time_scale": 1.0,
+        }
+        merged = jsonmerge.merge(default_params, params)
+        if len(_merged_params) >= MAX_CACHED_PARAMS:
+            _merged_params.clear()
+        _merged_params[id(params)] = (params, merged)
+    return merged
+
+
+def trace_replay(params):
+    params = _get_params(params)
+    service_time, response_size = _next_record(params)
+    if params["mode"] == "busy":
+        end = time.perf_counter() + service_time
+        while time.perf_counter() < end:
+            pass
+    else:
+        time.sleep(service_time)
+    return get_payload(max(1, int(1000 * response_size)))
+
+
+async def trace_replay_async(params, executor=None):
+    # Used by the asyncio engine: the sleep only suspends the current request.
+    params = _get_params(params)
+    if params["mode"] == "busy":
+        return await asyncio.get_running_loop().run_in_executor(executor, trace_replay, params)
+    service_time, response_size = _next_record(params)
+    await asyncio.sleep(service_time)
+    return get_payload(max(1, int(1000 * response_size)))
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description="Builds a trace-replay dataset from a CSV file of service,service_time_ms,response_size_kb rows"
+    )
+    parser.add_argument("input", help="CSV file, e.g., converted from the Alibaba traces")
+    parser.add_argument("output", help="dataset file, e.g., trace.bin")
+    args = parser.parse_args()
+
+    samples = dict()
+    with open(args.input) as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or row[0].startswith("#") or row[0] == "service":
+                continue
+            samples.setdefault(row[0], list()).append((float(row[1]), float(row[2])))
+    build_dataset(samples, args.output)
+    print(
+        f"Written {sum(len(s) for s in samples.values())} records of {len(samples)} services to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    _main()
@@ -5,6 +5,10 @@ import yaml
 DEFAULT_K8s_YAML_BUILDER_PATH = os.path.dirname(os.path.abspath(__file__))
 
 SIDECAR_TEMPLATE = "- name: %s-sidecar\n          image: %s"
+# node-shared directories of the Unix sockets of the service cells
+UDS_DEFAULT_DIR = "/var/run/mub"
+UDS_VOLUME_MOUNT_TEMPLATE = "- name: mub-sockets-%d\n              mountPath: %s"
+UDS_VOLUME_TEMPLATE = "- name: mub-sockets-%d\n          hostPath:\n            path: %s\n            type: DirectoryOrCreate"
 NODE_AFFINITY_TEMPLATE = {
     "affinity": {
         "nodeAffinity": {
@@ -94,6 +98,14 @@ def create_deployment_yaml_files(
     print(f"Using YAML builder path '{k8s_yaml_builder_path}'.")
 
     namespace = k8s_parameters["namespace"]
+    # every pod mounts the socket directories, to reach the local replicas of its external services
+    uds_dirs = sorted(
+        {
+            workmodel[service]["unix_socket"].get("dir", UDS_DEFAULT_DIR)
+            for service in workmodel
+            if "unix_socket" in workmodel[service]
+        }
+    )
     counter = 0
     for service in workmodel:
         # Skips entries that are not generated services.
@@ -163,6 +175,18 @@ def create_deployment_yaml_files(
                 f = f.replace("{{TN}}", f'\'{workmodel[service]["threads"]}\'')
             else:
                 f = f.replace("{{TN}}", "'4'")
+            f = f.replace(
+                "{{UDS_VOLUME_MOUNTS}}",
+                "\n            ".join(
+                    UDS_VOLUME_MOUNT_TEMPLATE % (i, uds_dir) for i, uds_dir in enumerate(uds_dirs)
+                ),
+            )
+            f = f.replace(
+                "{{UDS_VOLUMES}}",
+                "\n        ".join(
+                    UDS_VOLUME_TEMPLATE % (i, uds_dir) for i, uds_dir in enumerate(uds_dirs)
+                ),
+            )
 
             rank_string = ""  # ranck string is used to order the yaml file as a funciont of the cpu-requests
             if len(
@@ -1,3 +1,4 @@
+import base64
 from kubernetes import client, config, utils
 from kubernetes.client.rest import ApiException
 import yaml
@@ -5,6 +6,8 @@ import json
 import os
 import time
 
+CONFIGMAP_MAX_SIZE = 1024 * 1024  # bytes, limit of the ConfigMaps of Kubernetes
+
 
 def deploy_items(folder,st):
     print("######################")
@@ -179,6 +182,7 @@ def create_workmodel_configmap_data(k8s_parameters,work_model):
 def create_internal_service_configmap_data(params):
     k8s_parameters = params["K8sParameters"]
     data_dict=dict()
+    binary_data_dict=dict()
     metadata = client.V1ObjectMeta(
         name="internal-services",
         namespace=k8s_parameters["namespace"]
@@ -189,13 +193,21 @@ def create_internal_service_configmap_data(params):
         for file_name in src_files:
             full_file_name = os.path.join(internal_service_functions, file_name)
             if os.path.isfile(full_file_name):
-                with open(full_file_name, 'r') as f:
+                with open(full_file_name, 'rb') as f:
                     file_content=f.read()
-                    data_dict[file_name]=file_content           
+                try:
+                    data_dict[file_name]=file_content.decode("utf-8")
+                except UnicodeDecodeError:
+                    # e.g., trace-replay datasets
+                    binary_data_dict[file_name]=base64.b64encode(file_content).decode("ascii")
+    configmap_size = sum(len(v.encode()) for v in data_dict.values()) + sum(len(v) for v in binary_data_dict.values())
+    if configmap_size > CONFIGMAP_MAX_SIZE:
+        print(f"WARNING: the internal-services ConfigMap is {configmap_size} bytes, above the {CONFIGMAP_MAX_SIZE} bytes accepted by Kubernetes; mount large files, e.g., trace-replay datasets, with a volume")
     configmap = client.V1ConfigMap(
         api_version="v1",
         kind="ConfigMap",
         data=data_dict,
+        binary_data=binary_data_dict if len(binary_data_dict) else None,
         metadata=metadata
     )
     return configmap
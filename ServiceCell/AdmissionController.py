@@ -0,0 +1,171 @@
+import math
+import os
+import threading
+import time
+from typing import Mapping, Optional
+
+from gunicorn.workers.gthread import ThreadWorker
+from prometheus_client import Counter, Gauge
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+# "static" keeps the limit, "aimd" and "gradient" adapt it to the latency of the requests.
+LIMIT_ALGORITHMS = ("static", "aimd", "gradient")
+SHED_RESPONSES = ("reject", "degraded")
+
+# Header set by proxies with the time the request was received, e.g., "t=1690000000.123"
+REQUEST_START_HEADER = "x-request-start"
+
+ADMISSION_SHED = Counter(
+    "mub_admission_shed",
+    "Requests shed by the admission controller",
+    ["zone", "app_name", "reason"],
+)
+ADMISSION_LIMIT = Gauge(
+    "mub_admission_limit",
+    "Concurrency limit of the admission controller, summed over the workers",
+    ["zone", "app_name"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "mub_admission_in_flight",
+    "Requests admitted and not completed yet, summed over the workers",
+    ["zone", "app_name"],
+    multiprocess_mode="livesum",
+)
+
+
+# enqueue time of the connection served by the current thread of the worker
+_connection = threading.local()
+
+
+class QueueTimedThreadWorker(ThreadWorker):
+    """gthread worker that stamps the connections it queues for its thread pool."""
+
+    def enqueue_req(self, conn):
+        conn.mub_enqueued_at = time.monotonic()
+        super().enqueue_req(conn)
+
+    def handle(self, conn):
+        _connection.enqueued_at = getattr(conn, "mub_enqueued_at", None)
+        try:
+            return super().handle(conn)
+        finally:
+            _connection.enqueued_at = None
+
+
+def connection_enqueued_at() -> Optional[float]:
+    # monotonic time the request of the current thread was queued, None outside of QueueTimedThreadWorker
+    return getattr(_connection, "enqueued_at", None)
+
+
+def queue_delay(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Seconds the request waited before reaching the application: since the request start header,
+    whose unit is s, ms or us, else since the worker queued it for a thread. None without both.
+    """
+    value = headers.get(REQUEST_START_HEADER)
+    if value is None:
+        enqueued_at = connection_enqueued_at()
+        return None if enqueued_at is None else max(0.0, time.monotonic() - enqueued_at)
+    try:
+        start = float(value.strip().split("=")[-1])
+    except ValueError:
+        return None
+    if start > 1e14:
+        start = start / 1e6
+    elif start > 1e11:
+        start = start / 1e3
+    return max(0.0, time.time() - start)
+
+
+class AdmissionController:
+    """
+    Admits the requests of a worker process while fewer than `limit` are in flight and
+    their queueing delay is below `queue_delay_target_ms`. With "aimd", the limit grows by
+    one every `limit` requests faster than `latency_target_ms` and is multiplied by
+    `backoff_ratio` otherwise. With "gradient", it follows limit * min latency / latency,
+    plus sqrt(limit) of headroom.
+    """
+
+    def __init__(self, params: dict):
+        if params["algorithm"] not in LIMIT_ALGORITHMS:
+            raise ValueError(f"Unsupported admission control algorithm: {params['algorithm']}")
+        if params["response"] not in SHED_RESPONSES:
+            raise ValueError(f"Unsupported admission control response: {params['response']}")
+        self.params = params
+        self.algorithm = params["algorithm"]
+        self.response = params["response"]
+        self.min_limit = float(params["min_limit"])
+        self.max_limit = float(params["max_limit"])
+        self.limit = float(params["limit"])
+        self.queue_delay_target = (
+            None
+            if params["queue_delay_target_ms"] is None
+            else float(params["queue_delay_target_ms"]) / 1000
+        )
+        self._in_flight = 0
+        self._min_latency = None
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._limit_gauge = ADMISSION_LIMIT.labels(ZONE, K8S_APP)
+        self._in_flight_gauge = ADMISSION_IN_FLIGHT.labels(ZONE, K8S_APP)
+        self._pid = None
+
+    def try_acquire(self, delay: Optional[float] = None) -> Optional[str]:
+        """Returns None if the request is admitted, else the reason why it is shed."""
+        if self._pid != os.getpid():
+            # the limit of each worker is exported by the worker, after the fork of gunicorn
+            self._pid = os.getpid()
+            self._limit_gauge.set(self.limit)
+        if (
+            self.queue_delay_target is not None
+            and delay is not None
+            and delay > self.queue_delay_target
+        ):
+            reason = "queue_delay"
+        else:
+            with self._lock:
+                if self._in_flight >= int(self.limit):
+                    reason = "limit"
+                else:
+                    self._in_flight += 1
+                    reason = None
+        if reason is None:
+            self._in_flight_gauge.inc()
+        else:
+            ADMISSION_SHED.labels(ZONE, K8S_APP, reason).inc()
+        return reason
+
+    def release(self, latency: float, success: bool = True):
+        with self._lock:
+            self._in_flight -= 1
+            if self.algorithm == "aimd":
+                self._aimd(latency, success)
+            elif self.algorithm == "gradient":
+                self._gradient(latency)
+            limit = self.limit
+        self._in_flight_gauge.dec()
+        if self.algorithm != "static":
+            self._limit_gauge.set(limit)
+
+    def _aimd(self, latency: float, success: bool):
+        if success and latency <= float(self.params["latency_target_ms"]) / 1000:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.min_limit, self.limit * float(self.params["backoff_ratio"]))
+
+    def _gradient(self, latency: float):
+        # the no-load latency is the minimum one, forgotten every `probe_interval` samples
+        self._samples += 1
+        if self._min_latency is None or self._samples >= int(self.params["probe_interval"]):
+            self._min_latency, self._samples = latency, 0
+        self._min_latency = max(1e-6, min(self._min_latency, latency))
+        gradient = max(0.5, min(1.0, self._min_latency / max(latency, 1e-6)))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        smoothing = float(self.params["smoothing"])
+        self.limit = min(
+            self.max_limit,
+            max(self.min_limit, (1 - smoothing) * self.limit + smoothing * new_limit),
+        )
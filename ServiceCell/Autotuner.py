@@ -0,0 +1,219 @@
+import glob
+import json
+import logging
+import math
+import os
+import signal
+import threading
+import time
+
+from prometheus_client import Gauge, Summary
+
+from AdmissionController import connection_enqueued_at
+
+logger = logging.getLogger(__name__)
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+QUEUE_DELAY = Summary(
+    "mub_autotuner_queue_delay_seconds",
+    "Time the requests waited for a thread of the worker",
+    ["zone", "app_name"],
+)
+CPU_PER_REQUEST = Summary(
+    "mub_autotuner_cpu_per_request_seconds",
+    "CPU time of the worker process per request, by tuning interval",
+    ["zone", "app_name"],
+)
+IN_FLIGHT = Gauge(
+    "mub_autotuner_in_flight",
+    "Requests being served by the threads of the workers, summed over the workers",
+    ["zone", "app_name"],
+    multiprocess_mode="livesum",
+)
+THREADS = Gauge(
+    "mub_autotuner_threads",
+    "Threads serving the requests of each worker, chosen by the autotuner",
+    ["zone", "app_name"],
+    multiprocess_mode="liveall",
+)
+WORKERS = Gauge(
+    "mub_autotuner_workers",
+    "Gunicorn workers of the cell, chosen by the autotuner",
+    ["zone", "app_name"],
+    multiprocess_mode="livesum",
+)
+
+class Autotuner:
+    """
+    Adapts the threads of each worker between `min_threads` and `max_threads`, and the gunicorn
+    workers of the cell between `min_workers` and `max_workers`. Each worker serves its requests
+    on a pool of `max_threads` threads, of which only `threads` run at once; every `interval_s`
+    it measures the queueing delay of its requests, the CPU time of the worker per request and
+    the requests in flight. Threads grow by a quarter when the queueing delay exceeds
+    `queue_delay_target_ms` while the worker uses less than `cpu_target` of a CPU, since the GIL
+    serializes the CPU work of the threads; they shrink by one when two or more are idle.
+    The master adds a worker when the workers are queueing and use at least `cpu_target` of a
+    CPU, and removes one when the others could take its load at half of `cpu_target`.
+    """
+
+    def __init__(self, params: dict, stats_dir: str, threads: int, workers: int):
+        self.min_threads = max(1, int(params["min_threads"]))
+        self.max_threads = max(self.min_threads, int(params["max_threads"]))
+        self.min_workers = max(1, int(params["min_workers"]))
+        self.max_workers = max(self.min_workers, int(params["max_workers"]))
+        self.interval = float(params["interval_s"])
+        self.queue_delay_target = float(params["queue_delay_target_ms"]) / 1000
+        self.cpu_target = float(params["cpu_target"])
+        self.threads = min(self.max_threads, max(self.min_threads, threads))
+        self.workers = min(self.max_workers, max(self.min_workers, workers))
+        self.stats_dir = stats_dir
+        os.makedirs(stats_dir, exist_ok=True)
+        self._in_flight = 0
+        self._requests = 0
+        self._queue_delay = 0.0
+        self._busy_time = 0.0
+        self._cond = threading.Condition()
+        self._pid = None
+
+    ### workers
+
+    def wrap(self, wsgi_app):
+        # WSGI middleware running at most `threads` requests at once, the metrics are not gated
+        def tuned(environ, start_response):
+            if environ.get("PATH_INFO") == "/metrics":
+                return wsgi_app(environ, start_response)
+            self._check_pid()
+            enqueued_at = connection_enqueued_at() or time.monotonic()
+            with self._cond:
+                while self._in_flight >= self.threads:
+                    self._cond.wait()
+                self._in_flight += 1
+            start = time.monotonic()
+            delay = start - enqueued_at
+            QUEUE_DELAY.labels(ZONE, K8S_APP).observe(delay)
+            IN_FLIGHT.labels(ZONE, K8S_APP).inc()
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._requests += 1
+                    self._queue_delay += delay
+                    self._busy_time += time.monotonic() - start
+                    self._cond.notify()
+                IN_FLIGHT.labels(ZONE, K8S_APP).dec()
+
+        return tuned
+
+    def _check_pid(self):
+        # each worker tunes its threads from its first request, after the fork of gunicorn
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._requests, self._queue_delay, self._busy_time = 0, 0.0, 0.0
+        THREADS.labels(ZONE, K8S_APP).set(self.threads)
+        threading.Thread(target=self._tune_threads, daemon=True).start()
+
+    def _tune_threads(self):
+        last, last_cpu = time.monotonic(), time.process_time()
+        while True:
+            time.sleep(self.interval)
+            now, cpu = time.monotonic(), time.process_time()
+            with self._cond:
+                requests, queue_delay, busy_time = self._requests, self._queue_delay, self._busy_time
+                self._requests, self._queue_delay, self._busy_time = 0, 0.0, 0.0
+            stats = {
+                "time": time.time(),
+                "requests": requests,
+                "queue_delay": queue_delay / max(1, requests),
+                "utilization": (cpu - last_cpu) / (now - last),
+                "in_flight": busy_time / (now - last),
+            }
+            if requests > 0:
+                CPU_PER_REQUEST.labels(ZONE, K8S_APP).observe((cpu - last_cpu) / requests)
+            last, last_cpu = now, cpu
+            threads = self.next_threads(stats)
+            if threads != self.threads:
+                logger.info("Autotuner: threads %d -> %d, %s", self.threads, threads, stats)
+                with self._cond:
+                    self.threads = threads
+                    self._cond.notify_all()
+                THREADS.labels(ZONE, K8S_APP).set(threads)
+            self._publish(stats)
+
+    def next_threads(self, stats: dict) -> int:
+        if stats["requests"] == 0:
+            return self.threads
+        if stats["queue_delay"] > self.queue_delay_target and stats["utilization"] < self.cpu_target:
+            return min(self.max_threads, self.threads + math.ceil(self.threads / 4))
+        if stats["queue_delay"] <= self.queue_delay_target and stats["in_flight"] < self.threads - 2:
+            return max(self.min_threads, self.threads - 1)
+        return self.threads
+
+    def _publish(self, stats: dict):
+        # statistics of the last interval, read by the master to tune the workers
+        path = os.path.join(self.stats_dir, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(stats, f)
+        os.replace(f"{path}.tmp", path)
+
+    ### master
+
+    def start_master(self, server):
+        # gunicorn when_ready hook, workers are tuned with the TTIN and TTOU signals of the master
+        WORKERS.labels(ZONE, K8S_APP).set(server.num_workers)
+        if self.max_workers > self.min_workers:
+            threading.Thread(target=self._tune_workers, args=(server,), daemon=True).start()
+
+    def _tune_workers(self, server):
+        while True:
+            time.sleep(self.interval)
+            workers = self.next_workers(server.num_workers, self._worker_stats(set(server.WORKERS)))
+            if workers == server.num_workers:
+                continue
+            logger.info("Autotuner: workers %d -> %d", server.num_workers, workers)
+            os.kill(os.getpid(), signal.SIGTTIN if workers > server.num_workers else signal.SIGTTOU)
+            WORKERS.labels(ZONE, K8S_APP).set(workers)
+            # the next decision waits for the statistics of the new set of workers
+            time.sleep(self.interval)
+
+    def _worker_stats(self, pids: set) -> list:
+        stats = list()
+        for path in glob.glob(os.path.join(self.stats_dir, "*.json")):
+            if int(os.path.basename(path).split(".")[0]) not in pids:
+                # a stopped worker
+                os.remove(path)
+                continue
+            try:
+                with open(path) as f:
+                    worker_stats = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if time.time() - worker_stats["time"] <= 2 * self.interval:
+                stats.append(worker_stats)
+        return stats
+
+    def next_workers(self, workers: int, stats: list) -> int:
+        requests = sum(s["requests"] for s in stats)
+        if requests == 0:
+            return workers
+        queue_delay = sum(s["queue_delay"] * s["requests"] for s in stats) / requests
+        utilization = sum(s["utilization"] for s in stats)
+        if (
+            queue_delay > self.queue_delay_target
+            and utilization / len(stats) >= self.cpu_target
+            and workers < self.max_workers
+        ):
+            return workers + 1
+        if (
+            queue_delay <= self.queue_delay_target
+            and workers > self.min_workers
+            and utilization / (workers - 1) < self.cpu_target / 2
+        ):
+            return workers - 1
+        return workers
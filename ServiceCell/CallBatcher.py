@@ -0,0 +1,92 @@
+import os
+from typing import List, Optional, Tuple
+
+from prometheus_client import Counter
+
+import TraceCodec
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+# path of the batch endpoint, relative to the path of the service
+BATCH_PATH = "/batch"
+
+BATCH_CALLS = Counter(
+    "mub_batch_calls",
+    "Batch requests sent to external services",
+    ["zone", "app_name", "service"],
+)
+BATCHED_CALLS = Counter(
+    "mub_batched_calls",
+    "Calls to external services sent as sub-requests of batch requests",
+    ["zone", "app_name", "service"],
+)
+
+# calls of a batch: (group id, service name as in the group, e.g., s1__x)
+BatchCalls = List[Tuple[int, str]]
+
+
+class CallBatcher:
+    """
+    Groups the calls of a request to the same external service into batch requests of at most
+    `max_batch_size` sub-requests, served concurrently by the batch endpoint of the service.
+    Calls are batched across groups and along the sequence of a group, so batched calls of a
+    group are no longer sequential. `services` lists the batched external services, null for all.
+    """
+
+    def __init__(self, params: dict):
+        self.services = params["services"]
+        self.max_batch_size = max(1, int(params["max_batch_size"]))
+        self.min_batch_size = max(2, int(params["min_batch_size"]))
+
+    def partition(
+        self, selected: List[List[str]]
+    ) -> Tuple[List[Tuple[str, BatchCalls]], List[List[str]]]:
+        """
+        Splits the services selected in each group into batches (service, calls) and the services
+        still called one by one by each group.
+        """
+        calls = dict()
+        for id, services in enumerate(selected):
+            for service in services:
+                calls.setdefault(service.split("__")[0], list()).append((id, service))
+        batches = list()
+        batched = set()
+        for service, service_calls in calls.items():
+            if len(service_calls) < self.min_batch_size or (
+                self.services is not None and service not in self.services
+            ):
+                continue
+            for i in range(0, len(service_calls), self.max_batch_size):
+                batches.append((service, service_calls[i : i + self.max_batch_size]))
+            batched.update(service_calls)
+        remaining = [
+            [service for service in services if (id, service) not in batched]
+            for id, services in enumerate(selected)
+        ]
+        return batches, remaining
+
+    def request_body(self, calls: BatchCalls, trace: list, query_string: str) -> dict:
+        entries = list()
+        for id, service in calls:
+            entry = {"query_string": query_string}
+            if len(trace) > 0:
+                # binary subtrees are sent as JSON, like the rest of the batch
+                subtree = trace[id][service]
+                if isinstance(subtree, memoryview):
+                    entry["trace"] = TraceCodec.to_json(subtree)
+                else:
+                    entry["trace"] = {service: subtree}
+            entries.append(entry)
+        return {"requests": entries}
+
+    def sent(self, service: str, calls: BatchCalls):
+        BATCH_CALLS.labels(ZONE, K8S_APP, service).inc()
+        BATCHED_CALLS.labels(ZONE, K8S_APP, service).inc(len(calls))
+
+
+def batch_statuses(status_code: int, body: Optional[dict], calls: BatchCalls) -> List[int]:
+    # status of each call of a batch, the status of the batch request if it failed as a whole
+    if status_code != 200 or body is None:
+        return [status_code] * len(calls)
+    return [response["status"] for response in body["responses"]]
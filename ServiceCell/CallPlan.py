@@ -0,0 +1,149 @@
+import random
+from dataclasses import dataclass
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from InternalServiceExecutor import InternalService, resolve_internal_service
+
+DEFAULT_BEHAVIOUR = "default"
+
+
+@dataclass(frozen=True)
+class CallGroup:
+    """External-service group with the calling probability of each of its services."""
+
+    seq_len: int
+    services: Tuple[str, ...]
+    probabilities: Tuple[float, ...]
+
+
+@dataclass(frozen=True)
+class CallPlan:
+    """Internal service and external-service groups executed by a request."""
+
+    internal_service: InternalService
+    external_services: Tuple[CallGroup, ...]
+
+
+PlanKey = Tuple[str, Optional[str]]
+
+
+def compile_call_group(group: dict) -> CallGroup:
+    services = tuple(group["services"])
+    probabilities = group.get("probabilities", dict())
+    return CallGroup(
+        seq_len=int(group["seq_len"]),
+        services=services,
+        probabilities=tuple(float(probabilities.get(s, 1)) for s in services),
+    )
+
+
+def select_services(group: CallGroup) -> list:
+    # Randomly select seq_len services of the group, each one is then called with its probability
+    if group.seq_len < len(group.services):
+        indexes = random.sample(range(len(group.services)), k=group.seq_len)
+    else:
+        indexes = range(len(group.services))
+    return [group.services[i] for i in indexes if random.random() < group.probabilities[i]]
+
+
+def trace_call_groups(trace_groups: list) -> Tuple[CallGroup, ...]:
+    # trace-driven request: every service of a group is called, in order
+    return tuple(
+        CallGroup(
+            seq_len=len(group),
+            services=tuple(group.keys()),
+            probabilities=(1.0,) * len(group),
+        )
+        for group in trace_groups
+    )
+
+
+def compile_service_urls(work_model: dict) -> Dict[str, str]:
+    return {
+        service: f'http://{work_model[service]["url"]}{work_model[service]["path"]}'
+        for service in work_model
+    }
+
+
+def _by_request_type(value, request_type_dependent: bool) -> Dict[Optional[str], object]:
+    if request_type_dependent:
+        return dict(value)
+    return {None: value}
+
+
+def compile_work_model(work_model: dict, service_id: str) -> Dict[PlanKey, CallPlan]:
+    """
+    Compiles the work model of a service into call plans indexed by
+    (behaviour id, x-requesttype). The request type is None for services
+    whose internal and external services do not depend on it.
+    """
+    my_work_model = work_model[service_id]
+    internal_dependent = bool(
+        my_work_model.get("request_type_dependent_internal_service", False)
+    )
+    external_dependent = bool(
+        my_work_model.get("request_type_dependent_external_service", False)
+    )
+    behaviours = {DEFAULT_BEHAVIOUR: dict()}
+    behaviours.update(my_work_model.get("alternative_behaviors", dict()))
+
+    plans = dict()
+    for behaviour_id, behaviour in behaviours.items():
+        internal_services = _by_request_type(
+            behaviour.get("internal_service", my_work_model.get("internal_service", dict())),
+            internal_dependent,
+        )
+        external_services = _by_request_type(
+            behaviour.get(
+                "external_services", my_work_model.get("external_services", list())
+            ),
+            external_dependent,
+        )
+        request_types = set(internal_services) | set(external_services)
+        if internal_dependent or external_dependent:
+            request_types.discard(None)
+        for request_type in request_types:
+            internal_service = internal_services.get(
+                request_type, internal_services.get(None)
+            )
+            groups = external_services.get(request_type, external_services.get(None))
+            if internal_service is None or groups is None:
+                # the request type is defined for only one of the two
+                continue
+            plans[(behaviour_id, request_type)] = CallPlan(
+                internal_service=resolve_internal_service(internal_service),
+                external_services=tuple(compile_call_group(g) for g in groups),
+            )
+    return plans
+
+
+def get_call_plan(
+    plans: Dict[PlanKey, CallPlan], behaviour_id: str, request_type: Optional[str]
+) -> CallPlan:
+    """Returns the plan of a request; unknown behaviours fall back to the default one."""
+    plan = plans.get((behaviour_id, request_type))
+    if plan is None:
+        plan = plans.get((behaviour_id, None))
+    if plan is None and behaviour_id != DEFAULT_BEHAVIOUR:
+        return get_call_plan(plans, DEFAULT_BEHAVIOUR, request_type)
+    if plan is None:
+        raise KeyError(f"No call plan for request type {request_type}")
+    return plan
+
+
+class CompiledWorkModel(NamedTuple):
+    """Snapshot of the work model used by a cell; replaced as a whole on hot reload."""
+
+    version: int
+    work_model: dict
+    call_plans: Dict[PlanKey, CallPlan]
+    service_urls: Dict[str, str]
+
+
+def compile_cell(work_model: dict, service_id: str, version: int = 0) -> CompiledWorkModel:
+    return CompiledWorkModel(
+        version=version,
+        work_model=work_model,
+        call_plans=compile_work_model(work_model, service_id),
+        service_urls=compile_service_urls(work_model),
+    )
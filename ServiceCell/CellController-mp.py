@@ -1,6 +1,7 @@
 from __future__ import print_function
 
 import argparse
+import functools
 import json
 import os
 import sys
@@ -8,24 +9,63 @@ import time
 import traceback
 from threading import Thread
 from concurrent import futures
-from typing import Tuple
+from typing import Dict, Mapping, Tuple
+from urllib.parse import parse_qs
 import jsonmerge
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 # from multiprocessing import Array, Manager, Value
 
 import gunicorn.app.base
 from flask import Flask, Response, json, make_response, request
+from aiohttp import web
 import prometheus_client
 from prometheus_client import CollectorRegistry, Summary, multiprocess
 
-from ExternalServiceExecutor import init_REST, init_gRPC, run_external_service
-from InternalServiceExecutor import run_internal_service
+from ExternalServiceExecutor import (
+    init_REST,
+    init_gRPC,
+    init_fan_out_executor,
+    init_connection_pools,
+    init_edge_policies,
+    init_request_coalescer,
+    init_call_batching,
+    init_h2c_clients,
+    init_local_sockets,
+    close_async_sessions,
+    new_async_session,
+    run_external_service,
+    run_external_service_async,
+)
+from InternalServiceExecutor import (
+    InternalService,
+    init_internal_service_executor,
+    run_internal_service,
+    run_internal_service_async,
+)
+from CallPlan import (
+    CallGroup,
+    CallPlan,
+    PlanKey,
+    compile_cell,
+    get_call_plan,
+    trace_call_groups,
+)
+from AdmissionController import AdmissionController, QueueTimedThreadWorker, queue_delay
+from Autotuner import Autotuner
+from ResponseCache import ResponseCache
+from H2cTransport import PROTOCOLS, serve_h2c
+from UnixSockets import DEFAULT_SOCKET_DIR, listen_path
+from Deadline import DEADLINE_HEADER, DeadlineExceededError, drop, expired, request_deadline
+from WorkModelReloader import SharedWorkModel, WorkModelWatcher, default_shared_dir
 
 import mub_pb2_grpc as pb2_grpc
 import mub_pb2 as pb2
 import grpc
 
-import util
+import TraceCodec
+import InternalServiceExecutor
 
 import logging
 
@@ -58,37 +98,158 @@ K8S_APP = os.environ["K8S_APP"]  # K8s label app
 PN = os.environ["PN"]  # Number of processes
 TN = os.environ["TN"]  # Number of thread per process
 traceEscapeString = "__"
+WORK_MODEL_PATH = "MSConfig/workmodel.json"
+# keys of the service applied by a hot reload of the work model, the others are read at startup
+RELOADABLE_KEYS = (
+    "url",
+    "internal_service",
+    "external_services",
+    "alternative_behaviors",
+    "request_type_dependent_internal_service",
+    "request_type_dependent_external_service",
+)
 
 # globalDict=Manager().dict()
 globalDict = dict()
 
 
-def read_config_files():
+def shrink_work_model(workmodel: dict) -> dict:
     res = dict()
-    with open("MSConfig/workmodel.json") as f:
-        workmodel = json.load(f)
-        # shrink workmodel
-        for service in workmodel:
-            app.logger.info(f"service: {service}")
-            if service == ID:
-                res[service] = workmodel[service]
-            else:
-                res[service] = {
-                    "url": workmodel[service]["url"],
-                    "path": workmodel[service]["path"],
-                }
+    for service in workmodel:
+        app.logger.info(f"service: {service}")
+        if service == ID:
+            res[service] = workmodel[service]
+        else:
+            res[service] = {
+                "url": workmodel[service]["url"],
+                "path": workmodel[service]["path"],
+            }
+            # tells the callers whether the service accepts h2c and listens on Unix sockets
+            for key in ("transport", "unix_socket"):
+                if key in workmodel[service]:
+                    res[service][key] = workmodel[service][key]
     return res
 
 
-globalDict[
-    "work_model"
-] = read_config_files()  # must be shared among processes for hot update
+def read_config_files():
+    with open(WORK_MODEL_PATH) as f:
+        workmodel = json.load(f)
+    return shrink_work_model(workmodel)
+
+
+globalDict["work_model"] = read_config_files()
+
+# shared among processes for hot update
+shared_work_model = SharedWorkModel(
+    os.path.join(default_shared_dir(), f"mub-workmodel-{ID}"),
+    lambda work_model, version: compile_cell(work_model, ID, version),
+)
+shared_work_model.publish(globalDict["work_model"])
 
 if "request_method" in globalDict["work_model"][ID].keys():
     request_method = globalDict["work_model"][ID]["request_method"].lower()
 else:
     request_method = "rest"
 
+# "wsgi" serves requests with Flask on gunicorn threads, "asyncio" with aiohttp on an event loop.
+if "engine" in globalDict["work_model"][ID].keys():
+    engine = globalDict["work_model"][ID]["engine"].lower()
+else:
+    engine = "wsgi"
+
+init_internal_service_executor(
+    jsonmerge.merge(
+        {"strategy": "inline", "pool_size": TN},
+        globalDict["work_model"][ID].get("internal_service_executor", dict()),
+    )
+)
+# default time budget of the requests without a deadline header, none if budget_ms is null
+deadline_params = jsonmerge.merge(
+    {"budget_ms": None}, globalDict["work_model"][ID].get("deadline", dict())
+)
+# admission control of the requests of each worker, disabled without the admission_control key
+if "admission_control" in globalDict["work_model"][ID]:
+    admission_controller = AdmissionController(
+        jsonmerge.merge(
+            {
+                "algorithm": "static",
+                "limit": int(TN),
+                "min_limit": 1,
+                "max_limit": 10 * int(TN),
+                "latency_target_ms": 100,
+                "backoff_ratio": 0.9,
+                "probe_interval": 1000,
+                "smoothing": 0.2,
+                "queue_delay_target_ms": None,
+                "response": "reject",
+            },
+            globalDict["work_model"][ID]["admission_control"],
+        )
+    )
+else:
+    admission_controller = None
+# autotuning of the threads and workers of the cell, disabled without the autotuning key
+if "autotuning" in globalDict["work_model"][ID]:
+    autotuner = Autotuner(
+        jsonmerge.merge(
+            {
+                "min_threads": 1,
+                "max_threads": 4 * int(TN),
+                "min_workers": int(PN),
+                "max_workers": int(PN),
+                "interval_s": 5,
+                "queue_delay_target_ms": 10,
+                "cpu_target": 0.8,
+            },
+            globalDict["work_model"][ID]["autotuning"],
+        ),
+        os.path.join(default_shared_dir(), f"mub-autotuner-{ID}"),
+        int(TN),
+        int(PN),
+    )
+else:
+    autotuner = None
+# response cache shared by the workers of the pod, disabled without the response_cache key
+if "response_cache" in globalDict["work_model"][ID]:
+    response_cache = ResponseCache(
+        os.path.join(default_shared_dir(), f"mub-cache-{ID}"),
+        jsonmerge.merge(
+            {
+                "key": "query_string",
+                "entries": 1024,
+                "ways": 8,
+                "max_value_kb": 64,
+                "ttl_s": None,
+                "hit_ratio": 0.5,
+                "zipf_s": 1.0,
+                "key_space": 10000,
+            },
+            globalDict["work_model"][ID]["response_cache"],
+        ),
+    )
+else:
+    response_cache = None
+# batch endpoint, its sub-requests run on a thread pool of each worker, started after the fork
+batch_params = jsonmerge.merge(
+    {"max_batch_size": 64, "max_workers": 8 * int(TN)},
+    globalDict["work_model"][ID].get("batch_endpoint", dict()),
+)
+batch_executor = ThreadPoolExecutor(int(batch_params["max_workers"]))
+init_fan_out_executor(globalDict["work_model"][ID], TN, app)
+init_connection_pools(globalDict["work_model"][ID], app)
+init_edge_policies(globalDict["work_model"][ID], app)
+init_request_coalescer(globalDict["work_model"][ID], app)
+init_call_batching(globalDict["work_model"][ID], app)
+# "http1" serves requests with HTTP/1.1, "h2c" also accepts cleartext HTTP/2 and multiplexes its streams
+transport_params = jsonmerge.merge(
+    {"protocol": "http1", "connections": 2, "max_streams": 100},
+    globalDict["work_model"][ID].get("transport", dict()),
+)
+if transport_params["protocol"] not in PROTOCOLS:
+    raise ValueError(f"Unsupported transport protocol: {transport_params['protocol']}")
+init_h2c_clients(globalDict["work_model"], transport_params, app)
+init_local_sockets(globalDict["work_model"], globalDict["work_model"][ID], app)
+
 ########################### PROMETHEUS METRICS
 registry = CollectorRegistry()
 multiprocess.MultiProcessCollector(registry)
@@ -118,196 +279,192 @@ REQUEST_PROCESSING = Summary(
     ["zone", "app_name", "method", "endpoint", "from", "kubernetes_service"],
     registry=registry,
 )
+BATCH_SIZE = Summary(
+    "mub_batch_size",
+    "Sub-requests of the batch requests",
+    ["zone", "app_name"],
+    registry=registry,
+)
 
 
-def build_internal_service(my_work_model: dict, behaviour_id: str) -> dict:
-    if "internal_service" not in my_work_model:
-        app.logger.warning(
-            "The work model has no defined internal service. Using empty internal service intead."
-        )
-        return {}
+def build_call_plan(
+    call_plans: Dict[PlanKey, CallPlan],
+    behaviour_id: str,
+    headers: Mapping[str, str],
+    trace: dict,
+) -> Tuple[InternalService, Tuple[CallGroup, ...], list]:
+    # returns the internal service, the external-service groups and the groups of the trace, if any
+    plan = get_call_plan(call_plans, behaviour_id, headers.get("x-requesttype"))
+    if len(trace) == 0:
+        return plan.internal_service, plan.external_services, list()
 
-    my_internal_service = my_work_model["internal_service"]
+    # trace-driven request, sanity_check
+    assert len(trace.keys()) == 1, "bad trace format"
+    assert ID == list(trace)[0].split(traceEscapeString)[0], "bad trace format, ID"
+    trace_groups = trace[list(trace)[0]]
+    return plan.internal_service, trace_call_groups(trace_groups), trace_groups
+
+
+def cache_value(body) -> bytes:
+    return body.encode() if isinstance(body, str) else bytes(body)
 
-    # Loads load model based on the acquired message type.
-    if util.safe_get(my_work_model, "request_type_dependent_internal_service"):
-        message_type = request.headers.get("x-requesttype")
-        app.logger.info(
-            'Loading internal service of type "{message_type}"'.format(
-                message_type=message_type
-            )
-        )
-        my_internal_service = my_internal_service[message_type]
-
-    # update internal service behaviour
-    if behaviour_id != "default" and "alternative_behaviors" in my_work_model.keys():
-        if behaviour_id in my_work_model["alternative_behaviors"].keys():
-            if (
-                "internal_services"
-                in my_work_model["alternative_behaviors"][behaviour_id].keys()
-            ):
-                my_internal_service = my_work_model["alternative_behaviors"][
-                    behaviour_id
-                ]["internal_service"]
-    return my_internal_service
-
-
-def build_external_services(
-    my_work_model: dict, behaviour_id: str
-) -> Tuple[list, dict]:
-    if "external_services" not in my_work_model:
-        app.logger.warning(
-            "The work model has no defined external services. Using empty external services intead."
-        )
-        return [], {}
-
-    my_service_mesh = my_work_model["external_services"]
-
-    # if POST check the presence of a trace
-    trace = dict()
-    if request.method == "POST":
-        trace = request.json
-        # sanity_check
-        assert len(trace.keys()) == 1, "bad trace format"
-        assert ID == list(trace)[0].split(traceEscapeString)[0], "bad trace format, ID"
-        trace[ID] = trace[list(trace)[0]]  # We insert 1 more key "s0": [value]
-
-    # Load model based on request message type.
-    if util.safe_get(my_work_model, "request_type_dependent_external_service"):
-        message_type = request.headers.get("x-requesttype")
-        app.logger.info(
-            'Loading external service of type "{message_type}"'.format(
-                message_type=message_type
-            )
-        )
-        my_service_mesh = my_service_mesh[message_type]
-
-    if len(trace) > 0:
-        # trace-driven request
-        n_groups = len(trace[ID])
-        my_service_mesh = list()
-        for i in range(0, n_groups):
-            group = trace[ID][i]
-            group_dict = dict()
-            group_dict["seq_len"] = len(group)
-            group_dict["services"] = list(group.keys())
-            my_service_mesh.append(group_dict)
-    else:
-        # update external service behaviour
-        use_alternative_behaviour = (
-            behaviour_id != "default"
-            and "alternative_behaviors" in my_work_model.keys()
-        )
-        if use_alternative_behaviour and has_alternative_behaviour:
-            has_alternative_behaviour = (
-                behaviour_id in my_work_model["alternative_behaviors"].keys()
-            )
-            if has_alternative_behaviour:
-                if (
-                    "external_services"
-                    in my_work_model["alternative_behaviors"][behaviour_id].keys()
-                ):
-                    my_service_mesh = my_work_model["alternative_behaviors"][
-                        behaviour_id
-                    ]["external_services"]
 
-    return my_service_mesh, trace
+def deadline_exceeded(service_error_dict: dict) -> bool:
+    return any(isinstance(err, DeadlineExceededError) for err in service_error_dict.values())
 
 
-def build_headers() -> list:
+def build_headers(headers: Mapping[str, str]) -> dict:
     # trace context propagation
     jaeger_headers = dict()
     for jhdr in jaeger_headers_list:
-        val = request.headers.get(jhdr)
+        val = headers.get(jhdr)
         if val is not None:
             jaeger_headers[jhdr] = val
 
     # collects custom headers
     custom_headers = {
-        key: value for key, value in request.headers.items() if key.startswith("X-")
+        key: value for key, value in headers.items() if key.lower().startswith("x-")
     }
     jaeger_headers.update(custom_headers)
     return jaeger_headers
 
 
-@app.route(f"{globalDict['work_model'][ID]['path']}", methods=["GET", "POST"])
-def start_worker():
-    global globalDict
-
-    try:
-        start_request_processing = time.time()
-        app.logger.info("Request Received")
-
-        query_string = request.query_string.decode()
-        behaviour_id = request.args.get("bid", default="default", type=str)
-
-        # default behaviour
-        my_work_model = globalDict["work_model"][ID]
-
-        my_internal_service = build_internal_service(my_work_model, behaviour_id)
-        jaeger_headers = build_headers()
-        my_service_mesh, trace = build_external_services(my_work_model, behaviour_id)
-
-        # Execute the internal service
-        app.logger.info("*************** INTERNAL SERVICE STARTED ***************")
-        start_local_processing = time.time()
+def admission_controlled(view):
+    # sheds the requests refused by the admission controller with a 503 or an empty 200 response
+    if admission_controller is None:
+        return view
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        reason = admission_controller.try_acquire(queue_delay(request.headers))
+        if reason is not None:
+            if admission_controller.response == "degraded":
+                return make_response("", 200, {"x-mub-degraded": reason})
+            return make_response(json.dumps({"message": f"Overloaded ({reason})"}), 503)
+        start = time.monotonic()
+        success = False
+        try:
+            response = make_response(view(*args, **kwargs))
+            success = response.status_code < 500
+            return response
+        finally:
+            admission_controller.release(time.monotonic() - start, success)
+
+    return wrapper
+
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+TEXT_HEADERS = {"Content-Type": "text/plain"}
+
+
+def serve_request(
+    method: str,
+    path: str,
+    remote: str,
+    query_string: str,
+    behaviour_id: str,
+    headers: Mapping[str, str],
+    trace: dict,
+) -> Tuple[object, int, dict]:
+    # runs the internal and external services of a request, returns (body, status, headers)
+    start_request_processing = time.time()
+    deadline = request_deadline(headers, deadline_params["budget_ms"], time.monotonic())
+    if expired(deadline):
+        drop("expired")
+        return json.dumps({"message": "Deadline exceeded"}), 504, JSON_HEADERS
+
+    # a cached response skips the internal and external services; trace-driven requests are not cached
+    cache_key = None
+    if response_cache is not None and len(trace) == 0:
+        cache_key = response_cache.key(query_string, headers)
+        cached_body = response_cache.get(cache_key)
+        if cached_body is not None:
+            response_headers = build_headers(headers)
+            response_headers.update(TEXT_HEADERS)
+            response_headers["x-mub-cache"] = "hit"
+            REQUEST_PROCESSING.labels(ZONE, K8S_APP, method, path, remote, ID).observe(
+                time.time() - start_request_processing
+            )
+            return cached_body, 200, response_headers
 
-        # Overwrites the internal service with data that's written in the header.
-        body = run_internal_service(my_internal_service)
-        local_processing_latency = time.time() - start_local_processing
-        INTERNAL_PROCESSING.labels(ZONE, K8S_APP, request.method, request.path).observe(
-            local_processing_latency
+    compiled_work_model = shared_work_model.current()
+    my_internal_service, my_service_mesh, trace_groups = build_call_plan(
+        compiled_work_model.call_plans, behaviour_id, headers, trace
+    )
+    jaeger_headers = build_headers(headers)
+
+    # Execute the internal service
+    app.logger.info("*************** INTERNAL SERVICE STARTED ***************")
+    start_local_processing = time.time()
+
+    # Overwrites the internal service with data that's written in the header.
+    body = run_internal_service(my_internal_service)
+    local_processing_latency = time.time() - start_local_processing
+    INTERNAL_PROCESSING.labels(ZONE, K8S_APP, method, path).observe(local_processing_latency)
+    RESPONSE_SIZE.labels(ZONE, K8S_APP, method, path, remote, ID).observe(len(body))
+    app.logger.info("len(body): %d" % len(body))
+    app.logger.info("############### INTERNAL SERVICE FINISHED! ###############")
+
+    # Execute the external services
+    start_external_request_processing = time.time()
+    app.logger.info("*************** EXTERNAL SERVICES STARTED ***************")
+
+    if len(my_service_mesh) > 0:
+        service_error_dict = run_external_service(
+            my_service_mesh,
+            compiled_work_model.service_urls,
+            query_string,
+            trace_groups,
+            app,
+            jaeger_headers,
+            deadline,
         )
-        RESPONSE_SIZE.labels(
-            ZONE, K8S_APP, request.method, request.path, request.remote_addr, ID
-        ).observe(len(body))
-        app.logger.info("len(body): %d" % len(body))
-        app.logger.info("############### INTERNAL SERVICE FINISHED! ###############")
-
-        # Execute the external services
-        start_external_request_processing = time.time()
-        app.logger.info("*************** EXTERNAL SERVICES STARTED ***************")
-
-        if len(my_service_mesh) > 0:
-            if len(trace) > 0:
-                service_error_dict = run_external_service(
-                    my_service_mesh,
-                    globalDict["work_model"],
-                    query_string,
-                    trace[ID],
-                    app,
-                    jaeger_headers,
-                )
-            else:
-                service_error_dict = run_external_service(
-                    my_service_mesh,
-                    globalDict["work_model"],
-                    query_string,
-                    dict(),
-                    app,
-                    jaeger_headers,
-                )
-            if len(service_error_dict):
-                app.logger.error(service_error_dict)
-                app.logger.error("Error in request external services")
-                app.logger.error(service_error_dict)
-                return make_response(
-                    json.dumps({"message": "Error in external services request"}), 500
-                )
-        app.logger.info("############### EXTERNAL SERVICES FINISHED! ###############")
+        if len(service_error_dict):
+            app.logger.error("Error in request external services")
+            app.logger.error(service_error_dict)
+            if deadline_exceeded(service_error_dict):
+                return json.dumps({"message": "Deadline exceeded"}), 504, JSON_HEADERS
+            return json.dumps({"message": "Error in external services request"}), 500, JSON_HEADERS
+    app.logger.info("############### EXTERNAL SERVICES FINISHED! ###############")
+
+    if cache_key is not None:
+        response_cache.put(cache_key, cache_value(body))
+
+    EXTERNAL_PROCESSING.labels(ZONE, K8S_APP, method, path).observe(
+        time.time() - start_external_request_processing
+    )
+    REQUEST_PROCESSING.labels(ZONE, K8S_APP, method, path, remote, ID).observe(
+        time.time() - start_request_processing
+    )
 
-        response = make_response(body)
-        response.mimetype = "text/plain"
-        EXTERNAL_PROCESSING.labels(ZONE, K8S_APP, request.method, request.path).observe(
-            time.time() - start_external_request_processing
-        )
-        REQUEST_PROCESSING.labels(
-            ZONE, K8S_APP, request.method, request.path, request.remote_addr, ID
-        ).observe(time.time() - start_request_processing)
+    # Add trace context propagation headers to the response
+    jaeger_headers.update(TEXT_HEADERS)
+    return body, 200, jaeger_headers
 
-        # Add trace context propagation headers to the response
-        response.headers.update(jaeger_headers)
 
+@app.route(f"{globalDict['work_model'][ID]['path']}", methods=["GET", "POST"])
+@admission_controlled
+def start_worker():
+    try:
+        app.logger.info("Request Received")
+        if request.method != "POST":
+            trace = dict()
+        elif request.mimetype == TraceCodec.TRACE_CONTENT_TYPE:
+            trace = TraceCodec.decode(request.get_data())
+        else:
+            trace = request.json
+        body, status, headers = serve_request(
+            request.method,
+            request.path,
+            request.remote_addr,
+            request.query_string.decode(),
+            request.args.get("bid", default="default", type=str),
+            request.headers,
+            trace,
+        )
+        # payloads are memoryview slices of the payload arena, WSGI needs bytes
+        response = make_response(bytes(body) if isinstance(body, memoryview) else body, status)
+        response.headers.update(headers)
         return response
     except Exception as err:
         app.logger.error("Error in start_worker", err)
@@ -315,6 +472,54 @@ def start_worker():
         return json.dumps({"message": "Error"}), 500
 
 
+def serve_batch_entry(entry: dict, path: str, remote: str, headers: Mapping[str, str]) -> dict:
+    # a sub-request of a batch request, {"query_string": ..., "trace": ...} -> {"status": ..., "body": ...}
+    try:
+        query_string = entry.get("query_string", "")
+        body, status, _ = serve_request(
+            "POST" if entry.get("trace") else "GET",
+            path,
+            remote,
+            query_string,
+            parse_qs(query_string).get("bid", ["default"])[0],
+            headers,
+            entry.get("trace") or dict(),
+        )
+    except Exception as err:
+        app.logger.error("Error in batch sub-request: %s", err)
+        body, status = json.dumps({"message": "Error"}), 500
+    if not isinstance(body, str):
+        # the payloads are ASCII letters
+        body = bytes(body).decode("latin-1")
+    return {"status": status, "body": body}
+
+
+def batch_entries(batch: dict) -> list:
+    entries = batch["requests"]
+    if len(entries) > int(batch_params["max_batch_size"]):
+        raise ValueError(f"Batch larger than {batch_params['max_batch_size']} requests")
+    BATCH_SIZE.labels(ZONE, K8S_APP).observe(len(entries))
+    return entries
+
+
+@app.route(f"{globalDict['work_model'][ID]['path']}/batch", methods=["POST"])
+@admission_controlled
+def start_batch_worker():
+    # sub-requests run concurrently and are measured as requests of the path of the service
+    try:
+        entries = batch_entries(request.json)
+    except Exception as err:
+        return make_response(json.dumps({"message": f"Bad batch request: {err}"}), 400)
+    # the request context is not available in the threads of the executor
+    path, remote, headers = request.path[: -len("/batch")], request.remote_addr, request.headers
+    responses = list(
+        batch_executor.map(
+            lambda entry: serve_batch_entry(entry, path, remote, headers), entries
+        )
+    )
+    return make_response(json.dumps({"responses": responses}), 200, JSON_HEADERS)
+
+
 # Prometheus
 @app.route("/metrics")
 def metrics():
@@ -323,6 +528,314 @@ def metrics():
     )
 
 
+# CPU calibration table of the loader (complexity -> ms)
+def get_cpu_calibration():
+    calibration_function = getattr(InternalServiceExecutor, "get_cpu_calibration", None)
+    if calibration_function is None:
+        return None
+    return {str(c): ms for c, ms in calibration_function().items()}
+
+
+@app.route("/debug/cpu_calibration")
+def cpu_calibration():
+    calibration = get_cpu_calibration()
+    if calibration is None:
+        return make_response(json.dumps({"message": "Loader not available"}), 404)
+    return make_response(json.dumps(calibration), 200)
+
+
+# Hot reload of the work model, for all the workers of the cell
+def unapplied_changes(work_model: dict) -> list:
+    # keys changed by a new work model that a hot reload does not apply, they are read at startup
+    startup_work_model = globalDict["work_model"]
+    changes = list()
+    for service in set(startup_work_model) | set(work_model):
+        old, new = startup_work_model.get(service, dict()), work_model.get(service, dict())
+        reloadable = RELOADABLE_KEYS if service == ID else ("url", "path")
+        changes.extend(
+            f"{service}.{key}"
+            for key in set(old) | set(new)
+            if key not in reloadable and old.get(key) != new.get(key)
+        )
+    if len(changes) > 0:
+        app.logger.warning("Work model changes not applied until a redeployment: %s", sorted(changes))
+    return sorted(changes)
+
+
+def read_reloaded_config_files():
+    work_model = read_config_files()
+    unapplied_changes(work_model)
+    return work_model
+
+
+def reload_work_model(workmodel: dict) -> dict:
+    # an empty body reloads the mounted work model file
+    work_model = shrink_work_model(workmodel) if workmodel else read_config_files()
+    version = shared_work_model.publish(work_model)
+    return {"message": "Work model reloaded", "version": version, "not_applied": unapplied_changes(work_model)}
+
+
+@app.route("/admin/workmodel", methods=["POST"])
+def admin_reload_work_model():
+    try:
+        return make_response(
+            json.dumps(reload_work_model(request.get_json(silent=True))), 200
+        )
+    except Exception as err:
+        app.logger.error("Error in admin_reload_work_model: %s", err)
+        return make_response(json.dumps({"message": f"Error: {err}"}), 400)
+
+
+########################### ASYNCIO ENGINE
+# Serves the same work model on an aiohttp event loop. Downstream calls and sleeps are awaited,
+# blocking (CPU, memory, disk) work runs on a per-worker executor with TN threads.
+
+
+def admission_controlled_async(handler):
+    # asyncio counterpart of admission_controlled
+    if admission_controller is None:
+        return handler
+
+    @functools.wraps(handler)
+    async def wrapper(request: web.Request) -> web.Response:
+        reason = admission_controller.try_acquire(queue_delay(request.headers))
+        if reason is not None:
+            if admission_controller.response == "degraded":
+                return web.Response(text="", headers={"x-mub-degraded": reason})
+            return web.json_response({"message": f"Overloaded ({reason})"}, status=503)
+        start = time.monotonic()
+        success = False
+        try:
+            response = await handler(request)
+            success = response.status < 500
+            return response
+        finally:
+            admission_controller.release(time.monotonic() - start, success)
+
+    return wrapper
+
+
+async def serve_request_async(
+    method: str,
+    path: str,
+    remote: str,
+    query_string: str,
+    behaviour_id: str,
+    headers: Mapping[str, str],
+    trace: dict,
+    async_app: web.Application,
+) -> Tuple[object, int, dict]:
+    # asyncio counterpart of serve_request
+    start_request_processing = time.time()
+    deadline = request_deadline(headers, deadline_params["budget_ms"], time.monotonic())
+    if expired(deadline):
+        drop("expired")
+        return json.dumps({"message": "Deadline exceeded"}), 504, JSON_HEADERS
+
+    cache_key = None
+    if response_cache is not None and len(trace) == 0:
+        cache_key = response_cache.key(query_string, headers)
+        cached_body = response_cache.get(cache_key)
+        if cached_body is not None:
+            response_headers = build_headers(headers)
+            response_headers.update(TEXT_HEADERS)
+            response_headers["x-mub-cache"] = "hit"
+            REQUEST_PROCESSING.labels(ZONE, K8S_APP, method, path, remote, ID).observe(
+                time.time() - start_request_processing
+            )
+            return cached_body, 200, response_headers
+
+    compiled_work_model = shared_work_model.current()
+    my_internal_service, my_service_mesh, trace_groups = build_call_plan(
+        compiled_work_model.call_plans, behaviour_id, headers, trace
+    )
+    jaeger_headers = build_headers(headers)
+
+    # Execute the internal service
+    app.logger.info("*************** INTERNAL SERVICE STARTED ***************")
+    start_local_processing = time.time()
+    body = await run_internal_service_async(my_internal_service, async_app["executor"])
+    local_processing_latency = time.time() - start_local_processing
+    INTERNAL_PROCESSING.labels(ZONE, K8S_APP, method, path).observe(local_processing_latency)
+    RESPONSE_SIZE.labels(ZONE, K8S_APP, method, path, remote, ID).observe(len(body))
+    app.logger.info("len(body): %d" % len(body))
+    app.logger.info("############### INTERNAL SERVICE FINISHED! ###############")
+
+    # Execute the external services
+    start_external_request_processing = time.time()
+    app.logger.info("*************** EXTERNAL SERVICES STARTED ***************")
+    if len(my_service_mesh) > 0:
+        service_error_dict = await run_external_service_async(
+            my_service_mesh,
+            compiled_work_model.service_urls,
+            query_string,
+            trace_groups,
+            app,
+            async_app["client_session"],
+            jaeger_headers,
+            deadline,
+        )
+        if len(service_error_dict):
+            app.logger.error("Error in request external services")
+            app.logger.error(service_error_dict)
+            if deadline_exceeded(service_error_dict):
+                return json.dumps({"message": "Deadline exceeded"}), 504, JSON_HEADERS
+            return json.dumps({"message": "Error in external services request"}), 500, JSON_HEADERS
+    app.logger.info("############### EXTERNAL SERVICES FINISHED! ###############")
+
+    if cache_key is not None:
+        response_cache.put(cache_key, cache_value(body))
+
+    EXTERNAL_PROCESSING.labels(ZONE, K8S_APP, method, path).observe(
+        time.time() - start_external_request_processing
+    )
+    REQUEST_PROCESSING.labels(ZONE, K8S_APP, method, path, remote, ID).observe(
+        time.time() - start_request_processing
+    )
+
+    # Add trace context propagation headers to the response
+    jaeger_headers.update(TEXT_HEADERS)
+    return body, 200, jaeger_headers
+
+
+@admission_controlled_async
+async def start_worker_async(request: web.Request) -> web.Response:
+    try:
+        app.logger.info("Request Received")
+        if request.method != "POST":
+            trace = dict()
+        elif request.content_type == TraceCodec.TRACE_CONTENT_TYPE:
+            trace = TraceCodec.decode(await request.read())
+        else:
+            trace = await request.json()
+        body, status, headers = await serve_request_async(
+            request.method,
+            request.path,
+            request.remote,
+            request.query_string,
+            request.query.get("bid", "default"),
+            request.headers,
+            trace,
+            request.app,
+        )
+        if isinstance(body, str):
+            return web.Response(text=body, status=status, headers=headers)
+        return web.Response(body=body, status=status, headers=headers)
+    except Exception as err:
+        app.logger.error("Error in start_worker_async: %s", err)
+        return web.json_response({"message": "Error"}, status=500)
+
+
+async def serve_batch_entry_async(
+    entry: dict, path: str, remote: str, headers: Mapping[str, str], async_app: web.Application
+) -> dict:
+    # asyncio counterpart of serve_batch_entry
+    try:
+        query_string = entry.get("query_string", "")
+        body, status, _ = await serve_request_async(
+            "POST" if entry.get("trace") else "GET",
+            path,
+            remote,
+            query_string,
+            parse_qs(query_string).get("bid", ["default"])[0],
+            headers,
+            entry.get("trace") or dict(),
+            async_app,
+        )
+    except Exception as err:
+        app.logger.error("Error in batch sub-request: %s", err)
+        body, status = json.dumps({"message": "Error"}), 500
+    if not isinstance(body, str):
+        body = bytes(body).decode("latin-1")
+    return {"status": status, "body": body}
+
+
+@admission_controlled_async
+async def start_batch_worker_async(request: web.Request) -> web.Response:
+    try:
+        entries = batch_entries(await request.json())
+    except Exception as err:
+        return web.json_response({"message": f"Bad batch request: {err}"}, status=400)
+    path = request.path[: -len("/batch")]
+    responses = await asyncio.gather(
+        *[
+            serve_batch_entry_async(entry, path, request.remote, request.headers, request.app)
+            for entry in entries
+        ]
+    )
+    return web.json_response({"responses": responses})
+
+
+async def metrics_async(request: web.Request) -> web.Response:
+    return web.Response(
+        body=prometheus_client.generate_latest(registry),
+        headers={"Content-Type": CONTENT_TYPE_LATEST},
+    )
+
+
+async def cpu_calibration_async(request: web.Request) -> web.Response:
+    calibration = get_cpu_calibration()
+    if calibration is None:
+        return web.json_response({"message": "Loader not available"}, status=404)
+    return web.json_response(calibration)
+
+
+async def admin_reload_work_model_async(request: web.Request) -> web.Response:
+    try:
+        workmodel = await request.json() if request.can_read_body else None
+        return web.json_response(reload_work_model(workmodel))
+    except Exception as err:
+        app.logger.error("Error in admin_reload_work_model_async: %s", err)
+        return web.json_response({"message": f"Error: {err}"}, status=400)
+
+
+async def init_async_worker(async_app: web.Application):
+    # Runs in every gunicorn worker after the fork.
+    async_app["executor"] = ThreadPoolExecutor(int(TN))
+    async_app["client_session"] = new_async_session()
+
+
+async def close_async_worker(async_app: web.Application):
+    await async_app["client_session"].close()
+    await close_async_sessions()
+    async_app["executor"].shutdown(wait=False)
+
+
+def build_async_app() -> web.Application:
+    async_app = web.Application()
+    async_app.router.add_get(globalDict["work_model"][ID]["path"], start_worker_async)
+    async_app.router.add_post(globalDict["work_model"][ID]["path"], start_worker_async)
+    async_app.router.add_post(
+        f"{globalDict['work_model'][ID]['path']}/batch", start_batch_worker_async
+    )
+    async_app.router.add_get("/metrics", metrics_async)
+    async_app.router.add_post("/admin/workmodel", admin_reload_work_model_async)
+    async_app.router.add_get("/debug/cpu_calibration", cpu_calibration_async)
+    async_app.on_startup.append(init_async_worker)
+    async_app.on_cleanup.append(close_async_worker)
+    return async_app
+
+
+def warm_up_worker():
+    # run by each worker after the fork, before its first request
+    InternalServiceExecutor.warm_up_executor_pool()
+    InternalServiceExecutor.init_worker_internal_services(
+        plan.internal_service for plan in shared_work_model.current().call_plans.values()
+    )
+
+
+def post_worker_init(worker):
+    warm_up_worker()
+
+
+def worker_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
+
+
+# HttpServer does not load the gunicorn config file, its hooks are passed as options
+GUNICORN_HOOKS = {"post_worker_init": post_worker_init, "worker_exit": worker_exit}
+
+
 # Custom Gunicorn application: https://docs.gunicorn.org/en/stable/custom.html
 class HttpServer(gunicorn.app.base.BaseApplication):
     def __init__(self, app, options=None):
@@ -356,9 +869,16 @@ class gRPCThread(Thread, pb2_grpc.MicroServiceServicer):
     def GetMicroServiceResponse(self, req, context):
         try:
             start_request_processing = time.time()
-            app.logger.info.info("Request Received")
+            app.logger.info("Request Received")
             message = req.message
             remote_address = context.peer().split(":")[1]
+            # the gRPC deadline of the caller, if any, replaces the deadline header
+            time_remaining = context.time_remaining()
+            deadline = request_deadline(
+                {DEADLINE_HEADER: time_remaining * 1000} if time_remaining is not None else dict(),
+                deadline_params["budget_ms"],
+                time.monotonic(),
+            )
             app.logger.info(
                 f'I am service: {ID} and I received this message: --> "{message}"'
             )
@@ -366,7 +886,9 @@ class gRPCThread(Thread, pb2_grpc.MicroServiceServicer):
             # Execute the internal service
             app.logger.info("*************** INTERNAL SERVICE STARTED ***************")
             start_local_processing = time.time()
-            body = run_internal_service(my_work_model["internal_service"])
+            compiled_work_model = shared_work_model.current()
+            plan = get_call_plan(compiled_work_model.call_plans, "default", None)
+            body = run_internal_service(plan.internal_service)
             local_processing_latency = time.time() - start_local_processing
             INTERNAL_PROCESSING.labels(ZONE, K8S_APP, "grpc", "grpc").observe(
                 local_processing_latency
@@ -382,9 +904,14 @@ class gRPCThread(Thread, pb2_grpc.MicroServiceServicer):
             # Execute the external services
             app.logger.info("*************** EXTERNAL SERVICES STARTED ***************")
             start_external_request_processing = time.time()
-            if len(my_service_mesh) > 0:
+            if len(plan.external_services) > 0:
                 service_error_dict = run_external_service(
-                    my_service_mesh, globalDict["work_model"]
+                    plan.external_services,
+                    compiled_work_model.service_urls,
+                    "",
+                    list(),
+                    app,
+                    deadline=deadline,
                 )
                 if len(service_error_dict):
                     app.logger.error(service_error_dict)
@@ -399,7 +926,8 @@ class gRPCThread(Thread, pb2_grpc.MicroServiceServicer):
                 "############### EXTERNAL SERVICES FINISHED! ###############"
             )
 
-            result = {"text": body, "status_code": True}
+            text = body if isinstance(body, str) else bytes(body).decode("ascii")
+            result = {"text": text, "status_code": True}
             EXTERNAL_PROCESSING.labels(ZONE, K8S_APP, "grpc", "grpc").observe(
                 time.time() - start_external_request_processing
             )
@@ -422,15 +950,87 @@ class gRPCThread(Thread, pb2_grpc.MicroServiceServicer):
 
 
 if __name__ == "__main__":
-    if request_method == "rest":
+    hot_reload = jsonmerge.merge(
+        {"watch": True, "interval": 5}, globalDict["work_model"][ID].get("hot_reload", dict())
+    )
+    if hot_reload["watch"]:
+        WorkModelWatcher(
+            WORK_MODEL_PATH,
+            shared_work_model,
+            read_reloaded_config_files,
+            float(hot_reload["interval"]),
+        ).start()
+
+    # the cell also listens on a Unix socket in the directory shared by the pods of the node
+    binds = ["%s:%s" % ("0.0.0.0", 8080)]
+    if "unix_socket" in globalDict["work_model"][ID]:
+        socket_dir = globalDict["work_model"][ID]["unix_socket"].get("dir", DEFAULT_SOCKET_DIR)
+        binds.append("unix:%s" % listen_path(ID, socket_dir))
+
+    if autotuner is not None and (
+        engine != "wsgi" or request_method != "rest" or transport_params["protocol"] != "http1"
+    ):
+        app.logger.info("Warning: Autotuning only supports the wsgi engine with REST over HTTP/1.1, disabled")
+        autotuner = None
+
+    if engine == "asyncio":
+        if request_method != "rest":
+            app.logger.info("Error: The asyncio engine only supports the rest request method")
+            sys.exit(0)
+        if transport_params["protocol"] == "h2c":
+            app.logger.info("Error: The asyncio engine does not serve the h2c transport")
+            sys.exit(0)
+        # Start Gunicorn with aiohttp workers (multi-process, one event loop per process)
+        options_gunicorn = {
+            "bind": binds,
+            "workers": PN,
+            "config": "/app/gunicorn.conf.py",
+            "worker_class": "aiohttp.GunicornWebWorker",
+            **GUNICORN_HOOKS,
+        }
+        HttpServer(build_async_app(), options_gunicorn).run()
+    elif request_method == "rest" and transport_params["protocol"] == "h2c":
+        init_REST(app)
+        # Start Hypercorn HTTP/1.1 and h2c REST Server (multi-process)
+        serve_h2c(
+            app,
+            binds,
+            PN,
+            TN,
+            transport_params,
+            on_worker_start=warm_up_worker,
+            on_worker_exit=multiprocess.mark_process_dead,
+        )
+    elif request_method == "rest":
         init_REST(app)
         # Start Gunicorn HTTP REST Server (multi-process)
         options_gunicorn = {
-            "bind": "%s:%s" % ("0.0.0.0", 8080),
+            "bind": binds,
             "workers": PN,
             "config": "/app/gunicorn.conf.py",
             "threads": TN,
+            **GUNICORN_HOOKS,
         }
+        if admission_controller is not None:
+            # the workers stamp the queued requests and have threads up to max_limit, so that the
+            # requests beyond the limit reach the controller and are shed instead of waiting
+            options_gunicorn.update(
+                {
+                    "threads": max(int(TN), int(admission_controller.max_limit)),
+                    "worker_class": QueueTimedThreadWorker,
+                }
+            )
+        if autotuner is not None:
+            # the workers run the requests on max_threads threads, gated to the tuned number
+            app.wsgi_app = autotuner.wrap(app.wsgi_app)
+            options_gunicorn.update(
+                {
+                    "workers": autotuner.workers,
+                    "threads": autotuner.max_threads,
+                    "worker_class": QueueTimedThreadWorker,
+                    "when_ready": autotuner.start_master,
+                }
+            )
         HttpServer(app, options_gunicorn).run()
     elif request_method == "grpc":
         my_work_model = globalDict["work_model"][ID]
@@ -0,0 +1,219 @@
+import os
+import socket
+import threading
+import time
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.exceptions import NewConnectionError
+from prometheus_client import Counter
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+POOL_HITS = Counter(
+    "mub_connection_pool_hits",
+    "Requests to external services that reused a kept-alive connection",
+    ["zone", "app_name", "service"],
+)
+POOL_MISSES = Counter(
+    "mub_connection_pool_misses",
+    "Requests to external services that found no reusable connection in the pool",
+    ["zone", "app_name", "service"],
+)
+POOL_NEW_CONNECTIONS = Counter(
+    "mub_connection_pool_new_connections",
+    "Connections opened towards external services",
+    ["zone", "app_name", "service"],
+)
+
+
+class CountingHTTPConnection(HTTPConnection):
+    """HTTP connection that counts its TCP (or Unix socket) connects, also the reconnects of a pooled connection."""
+
+    mub_service = ""
+    mub_connected = False
+
+    def connect(self):
+        POOL_NEW_CONNECTIONS.labels(ZONE, K8S_APP, self.mub_service).inc()
+        self.mub_connected = True
+        return super().connect()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """
+    HTTP connection pool that closes idle connections and counts hits, misses and new connections.
+    A request is a hit when it is sent over an open connection, a miss when it had to connect.
+    """
+
+    ConnectionCls = CountingHTTPConnection
+
+    def __init__(self, *args, service="", idle_timeout=None, **kwargs):
+        self.service = service
+        self.idle_timeout = idle_timeout
+        super().__init__(*args, **kwargs)
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        if getattr(conn, "sock", None) is not None and self.idle_timeout is not None:
+            if time.monotonic() - getattr(conn, "mub_last_used", 0) > self.idle_timeout:
+                conn.close()
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.mub_last_used = time.monotonic()
+        super()._put_conn(conn)
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.mub_service = self.service
+        return conn
+
+    def _make_request(self, conn, *args, **kwargs):
+        # the connection connects while the request is sent, if its socket is not open
+        conn.mub_connected = False
+        try:
+            return super()._make_request(conn, *args, **kwargs)
+        finally:
+            if conn.mub_connected:
+                POOL_MISSES.labels(ZONE, K8S_APP, self.service).inc()
+            else:
+                POOL_HITS.labels(ZONE, K8S_APP, self.service).inc()
+
+
+class UnixHTTPConnection(CountingHTTPConnection):
+    """HTTP connection over a Unix socket, the host of the URL only fills the Host header."""
+
+    def __init__(self, *args, socket_path="", **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as err:
+            sock.close()
+            raise NewConnectionError(self, f"Failed to connect to {self.socket_path}: {err}")
+        return sock
+
+
+class UnixHTTPConnectionPool(CountingHTTPConnectionPool):
+    ConnectionCls = UnixHTTPConnection
+
+
+class UnixHTTPAdapter(HTTPAdapter):
+    """Sends all the requests of the session to one Unix socket."""
+
+    def __init__(self, service, socket_path, idle_timeout, pool_maxsize, pool_block=False):
+        self.pool = UnixHTTPConnectionPool(
+            "localhost",
+            service=service,
+            idle_timeout=idle_timeout,
+            maxsize=pool_maxsize,
+            block=pool_block,
+            socket_path=socket_path,
+        )
+        super().__init__()
+
+    def get_connection(self, url, proxies=None):
+        return self.pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        # used instead of get_connection by requests >= 2.32
+        return self.pool
+
+    def close(self):
+        self.pool.close()
+        super().close()
+
+
+class ServiceHTTPAdapter(HTTPAdapter):
+    def __init__(self, service, idle_timeout, **kwargs):
+        self.service = service
+        self.idle_timeout = idle_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": partial(
+                CountingHTTPConnectionPool,
+                service=self.service,
+                idle_timeout=self.idle_timeout,
+            ),
+            "https": self.poolmanager.pool_classes_by_scheme["https"],
+        }
+
+
+class ConnectionPools:
+    """
+    Keeps one requests.Session, and thus one keep-alive connection pool, per external service url.
+    `params` holds the default "pool_size", "keep_alive" and "idle_timeout" (seconds, None to disable),
+    and per-service overrides of them in "services".
+    """
+
+    def __init__(self, params: dict):
+        self.params = params
+        self._sessions = dict()
+        self._lock = threading.Lock()
+
+    def _service_params(self, service: str) -> dict:
+        service_params = dict(self.params)
+        service_params.update(self.params.get("services", dict()).get(service, dict()))
+        return service_params
+
+    def _new_session(self, service: str) -> requests.Session:
+        params = self._service_params(service)
+        pool_size = int(params["pool_size"])
+        session = requests.Session()
+        adapter = ServiceHTTPAdapter(
+            service,
+            params["idle_timeout"],
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=bool(params.get("pool_block", False)),
+        )
+        session.mount("http://", adapter)
+        if not params["keep_alive"]:
+            session.headers["Connection"] = "close"
+        return session
+
+    def get_unix_session(self, service: str, socket_path: str) -> requests.Session:
+        # one session per Unix socket of the local replicas of the service
+        session = self._sessions.get(socket_path)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(socket_path)
+                if session is None:
+                    params = self._service_params(service)
+                    session = requests.Session()
+                    adapter = UnixHTTPAdapter(
+                        service,
+                        socket_path,
+                        params["idle_timeout"],
+                        int(params["pool_size"]),
+                        bool(params.get("pool_block", False)),
+                    )
+                    session.mount("http://", adapter)
+                    if not params["keep_alive"]:
+                        session.headers["Connection"] = "close"
+                    self._sessions[socket_path] = session
+        return session
+
+    def get_session(self, service: str, service_urls: dict) -> requests.Session:
+        url = service_urls[service]
+        session = self._sessions.get(url)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(url)
+                if session is None:
+                    session = self._new_session(service)
+                    self._sessions[url] = session
+        return session
@@ -0,0 +1,70 @@
+import os
+import time
+from typing import Mapping, Optional
+
+from prometheus_client import Counter
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+# Remaining time budget of the request in milliseconds, relative to its reception by the cell,
+# so that the clocks of the pods do not need to be synchronized.
+DEADLINE_HEADER = "x-mub-deadline-ms"
+
+DEADLINE_DROPPED = Counter(
+    "mub_deadline_dropped_calls",
+    "Requests and external service calls dropped because of the request deadline",
+    ["zone", "app_name", "reason"],
+)
+
+
+class DeadlineExceededError(Exception):
+    """Raised for external services not called, or timed out, because of the request deadline."""
+
+
+def request_deadline(
+    headers: Mapping[str, str], budget_ms: Optional[float], start: float
+) -> Optional[float]:
+    """
+    Returns the deadline of a request received at `start` (time.monotonic()), None if it has none:
+    the budget of the deadline header, limited by the default budget of the service, if any.
+    """
+    budgets = list()
+    if headers.get(DEADLINE_HEADER) is not None:
+        budgets.append(float(headers.get(DEADLINE_HEADER)))
+    if budget_ms is not None:
+        budgets.append(float(budget_ms))
+    if len(budgets) == 0:
+        return None
+    return start + min(budgets) / 1000
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    # seconds left before the deadline, None if there is no deadline
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def call_timeout(deadline: Optional[float]) -> Optional[float]:
+    # timeout of a downstream call, HTTP clients require a positive one
+    if deadline is None:
+        return None
+    return max(0.001, remaining(deadline))
+
+
+def expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def deadline_headers(headers: dict, deadline: Optional[float]) -> dict:
+    # headers of a downstream call, with the budget left to the callee
+    if deadline is None:
+        return headers
+    headers = {k: v for k, v in (headers or dict()).items() if k.lower() != DEADLINE_HEADER}
+    headers[DEADLINE_HEADER] = str(max(0, int(remaining(deadline) * 1000)))
+    return headers
+
+
+def drop(reason: str, count: int = 1):
+    DEADLINE_DROPPED.labels(ZONE, K8S_APP, reason).inc(count)
@@ -0,0 +1,285 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Awaitable, Callable, Optional
+
+import jsonmerge
+from prometheus_client import Counter
+
+from Deadline import expired, remaining
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+DEFAULT_EDGE = "default"
+
+HEDGES_FIRED = Counter(
+    "mub_hedges_fired",
+    "Hedged calls to external services",
+    ["zone", "app_name", "service"],
+)
+HEDGES_WON = Counter(
+    "mub_hedges_won",
+    "Hedged calls to external services that answered before the original call",
+    ["zone", "app_name", "service"],
+)
+RETRIES = Counter(
+    "mub_retries",
+    "Retried calls to external services",
+    ["zone", "app_name", "service"],
+)
+RETRY_BUDGET_EXHAUSTED = Counter(
+    "mub_retry_budget_exhausted",
+    "Failed calls to external services not retried because the retry budget was exhausted",
+    ["zone", "app_name", "service"],
+)
+
+
+class EdgePolicy:
+    """
+    Hedging and retry policy of the calls to an external service.
+    Hedges are sent after the `percentile` latency of the last `window` successful calls.
+    Retries are allowed while the budget has tokens: every call adds `budget_ratio` tokens
+    (up to `max_tokens`) and every retry takes one, so retries stay below that fraction of the calls.
+    """
+
+    def __init__(self, service: str, params: dict):
+        self.service = service
+        self.hedge = params.get("hedge")
+        self.retry = params.get("retry")
+        self._lock = threading.Lock()
+        if self.hedge is not None:
+            self._latencies = deque(maxlen=int(self.hedge["window"]))
+            self._hedge_delay = None
+            self._new_samples = 0
+        if self.retry is not None:
+            self._tokens = float(self.retry["max_tokens"])
+
+    def observe(self, latency: float):
+        if self.hedge is None:
+            return
+        with self._lock:
+            self._latencies.append(latency)
+            self._new_samples += 1
+            # the percentile is recomputed every window/10 samples, not at every call
+            if len(self._latencies) >= int(self.hedge["min_samples"]) and (
+                self._hedge_delay is None
+                or self._new_samples >= max(1, self._latencies.maxlen // 10)
+            ):
+                latencies = sorted(self._latencies)
+                index = min(
+                    len(latencies) - 1,
+                    int(len(latencies) * float(self.hedge["percentile"]) / 100),
+                )
+                self._hedge_delay = max(
+                    latencies[index], float(self.hedge["min_delay_ms"]) / 1000
+                )
+                self._new_samples = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        # None until enough latencies have been observed
+        return self._hedge_delay if self.hedge is not None else None
+
+    def deposit(self):
+        if self.retry is None:
+            return
+        with self._lock:
+            self._tokens = min(
+                float(self.retry["max_tokens"]),
+                self._tokens + float(self.retry["budget_ratio"]),
+            )
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def backoff(self, attempt: int) -> float:
+        # exponential backoff, with +-jitter relative randomization
+        delay = float(self.retry["backoff_ms"]) / 1000 * 2 ** attempt
+        jitter = float(self.retry["jitter"])
+        return max(0.0, delay * random.uniform(1 - jitter, 1 + jitter))
+
+    def should_retry(self, attempt: int, deadline: Optional[float]) -> bool:
+        if self.retry is None or attempt >= int(self.retry["max_retries"]):
+            return False
+        if expired(deadline):
+            return False
+        if not self.withdraw():
+            RETRY_BUDGET_EXHAUSTED.labels(ZONE, K8S_APP, self.service).inc()
+            return False
+        RETRIES.labels(ZONE, K8S_APP, self.service).inc()
+        return True
+
+
+class EdgePolicies:
+    """Edge policies by external service; `params` holds the "default" policy and per-service overrides."""
+
+    def __init__(self, params: dict):
+        self.params = params
+        self._policies = dict()
+        self._lock = threading.Lock()
+
+    def get(self, service: str) -> Optional[EdgePolicy]:
+        if service not in self._policies:
+            with self._lock:
+                if service not in self._policies:
+                    self._policies[service] = self._new_policy(service)
+        return self._policies[service]
+
+    def _new_policy(self, service: str) -> Optional[EdgePolicy]:
+        params = jsonmerge.merge(
+            self.params.get(DEFAULT_EDGE, dict()), self.params.get(service, dict())
+        )
+        if params.get("hedge") is None and params.get("retry") is None:
+            return None
+        default_params = dict()
+        if params.get("hedge") is not None:
+            default_params["hedge"] = {
+                "percentile": 95,
+                "min_delay_ms": 1,
+                "window": 1000,
+                "min_samples": 20,
+            }
+        if params.get("retry") is not None:
+            default_params["retry"] = {
+                "max_retries": 1,
+                "budget_ratio": 0.1,
+                "max_tokens": 10,
+                "backoff_ms": 5,
+                "jitter": 0.5,
+            }
+        return EdgePolicy(service, jsonmerge.merge(default_params, params))
+
+
+def _timed(call: Callable):
+    start = time.monotonic()
+    result = call()
+    return result, time.monotonic() - start
+
+
+def call_with_policy(
+    policy: EdgePolicy,
+    call: Callable,
+    is_success: Callable,
+    submit_if_idle: Callable[..., Optional[Future]],
+    deadline: Optional[float] = None,
+    hedge_call: Optional[Callable] = None,
+):
+    """
+    Calls an external service with the hedging and retry policy of the edge.
+    The original and hedged calls run on idle threads of `submit_if_idle`; without idle threads,
+    the call is made by the current thread and not hedged.
+    The hedged call is `hedge_call`, if given (e.g., over a new connection), else `call`.
+    """
+    attempt = 0
+    while True:
+        policy.deposit()
+        result = _hedged_call(policy, call, is_success, submit_if_idle, deadline, hedge_call or call)
+        if is_success(result) or not policy.should_retry(attempt, deadline):
+            return result
+        backoff = policy.backoff(attempt)
+        left = remaining(deadline)
+        time.sleep(backoff if left is None else max(0.0, min(backoff, left)))
+        attempt += 1
+
+
+def _hedged_call(policy, call, is_success, submit_if_idle, deadline, hedge_call):
+    delay = policy.hedge_delay()
+    original = submit_if_idle(_timed, call) if delay is not None else None
+    if original is None:
+        result, latency = _timed(call)
+        if is_success(result):
+            policy.observe(latency)
+        return result
+
+    left = remaining(deadline)
+    done, _ = wait([original], timeout=delay if left is None else max(0.0, min(delay, left)))
+    pending = [original]
+    hedge = None
+    if len(done) == 0 and not expired(deadline):
+        hedge = submit_if_idle(_timed, hedge_call)
+        if hedge is not None:
+            HEDGES_FIRED.labels(ZONE, K8S_APP, policy.service).inc()
+            pending.append(hedge)
+
+    # the first successful answer wins, else the last failed one is returned
+    while True:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+            result, latency = future.result()
+            if is_success(result):
+                policy.observe(latency)
+                if future is hedge:
+                    HEDGES_WON.labels(ZONE, K8S_APP, policy.service).inc()
+                return result
+            if len(pending) == 0:
+                return result
+
+
+async def call_with_policy_async(
+    policy: EdgePolicy,
+    call: Callable[[], Awaitable],
+    is_success: Callable,
+    deadline: Optional[float] = None,
+    hedge_call: Optional[Callable[[], Awaitable]] = None,
+):
+    """asyncio counterpart of call_with_policy, the hedged call is a task of the event loop."""
+    attempt = 0
+    while True:
+        policy.deposit()
+        result = await _hedged_call_async(policy, call, is_success, deadline, hedge_call or call)
+        if is_success(result) or not policy.should_retry(attempt, deadline):
+            return result
+        backoff = policy.backoff(attempt)
+        left = remaining(deadline)
+        await asyncio.sleep(backoff if left is None else max(0.0, min(backoff, left)))
+        attempt += 1
+
+
+async def _timed_async(call: Callable[[], Awaitable]):
+    start = time.monotonic()
+    result = await call()
+    return result, time.monotonic() - start
+
+
+async def _hedged_call_async(policy, call, is_success, deadline, hedge_call):
+    delay = policy.hedge_delay()
+    original = asyncio.ensure_future(_timed_async(call))
+    if delay is None:
+        result, latency = await original
+        if is_success(result):
+            policy.observe(latency)
+        return result
+
+    left = remaining(deadline)
+    done, _ = await asyncio.wait(
+        [original], timeout=delay if left is None else max(0.0, min(delay, left))
+    )
+    pending = {original}
+    hedge = None
+    if len(done) == 0 and not expired(deadline):
+        hedge = asyncio.ensure_future(_timed_async(hedge_call))
+        HEDGES_FIRED.labels(ZONE, K8S_APP, policy.service).inc()
+        pending.add(hedge)
+
+    while True:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            result, latency = task.result()
+            if is_success(result):
+                policy.observe(latency)
+                if task is hedge:
+                    HEDGES_WON.labels(ZONE, K8S_APP, policy.service).inc()
+                for other in pending:
+                    other.cancel()
+                return result
+        if len(pending) == 0:
+            return result
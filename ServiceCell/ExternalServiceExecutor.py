@@ -1,17 +1,150 @@
-import random
 from readline import append_history_file
 import requests
-from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from concurrent.futures import as_completed, TimeoutError
 import time
 import grpc
 import mub_pb2_grpc as pb2_grpc
 import mub_pb2 as pb2
 import json
-from pprint import pprint
+import asyncio
+import aiohttp
+import jsonmerge
+from FanOutExecutor import FanOutExecutor, FanOutRejectedError
+from ConnectionPools import ConnectionPools
+from TraceCodec import TRACE_CONTENT_TYPE
+from EdgePolicies import EdgePolicies, call_with_policy, call_with_policy_async
+from RequestCoalescer import RequestCoalescer
+from CallBatcher import BATCH_PATH, CallBatcher, batch_statuses
+from H2cTransport import TIMEOUT_ERRORS, H2cClients, h2c_services
+from UnixSockets import FallbackSession, LocalSockets, observe, unix_socket_services
+from CallPlan import select_services
+from Deadline import DeadlineExceededError, call_timeout, deadline_headers, drop, expired, remaining
 
 
 service_stub = dict()
-s = requests.Session()
+fan_out_executor = None
+connection_pools = None
+async_limit_per_host = 0
+edge_policies = EdgePolicies(dict())
+request_coalescer = None
+call_batcher = None
+h2c_clients = None
+local_sockets = None
+unix_async_sessions = dict()
+
+def max_group_count(my_work_model):
+    # largest number of external service groups a request of this service can fan out to
+    meshes = [my_work_model.get("external_services", [])]
+    for behaviour in my_work_model.get("alternative_behaviors", dict()).values():
+        meshes.append(behaviour.get("external_services", []))
+    counts = [1]
+    for mesh in meshes:
+        if isinstance(mesh, dict):
+            # request type dependent external services
+            counts.extend(len(groups) for groups in mesh.values())
+        else:
+            counts.append(len(mesh))
+    return max(counts)
+
+def uses_hedging(my_work_model):
+    # whether the edge policies of the service hedge the calls to some external service
+    return any(
+        isinstance(policy, dict) and policy.get("hedge") is not None
+        for policy in my_work_model.get("edge_policies", dict()).values()
+    )
+
+def init_fan_out_executor(my_work_model, threads, app):
+    global fan_out_executor
+    default_params = {
+        "max_workers": max_group_count(my_work_model) * int(threads),
+        "saturation_policy": "queue",
+        "max_queue_size": 0,
+        "hedge_workers": None,
+    }
+    params = jsonmerge.merge(default_params, my_work_model.get("fan_out_executor", dict()))
+    if params["hedge_workers"] is None:
+        # with hedging, threads for the original and the hedged call of every thread of the pool
+        params["hedge_workers"] = 2 * int(params["max_workers"]) if uses_hedging(my_work_model) else 0
+    app.logger.info("Init fan-out executor: %s" % params)
+    fan_out_executor = FanOutExecutor(params["max_workers"], params["saturation_policy"], params["max_queue_size"], params["hedge_workers"])
+
+def init_connection_pools(my_work_model, app):
+    # per external service keep-alive pools, by default as large as the fan-out executor
+    global connection_pools, async_limit_per_host
+    default_params = {
+        "pool_size": fan_out_executor.max_workers,
+        "keep_alive": True,
+        "idle_timeout": None,
+        "services": dict(),
+    }
+    params = jsonmerge.merge(default_params, my_work_model.get("connection_pool", dict()))
+    app.logger.info("Init connection pools: %s" % params)
+    connection_pools = ConnectionPools(params)
+    # the asyncio engine is not bound by the threads of the fan-out executor, so its
+    # connections per external service are unlimited unless pool_size is set explicitly
+    async_limit_per_host = int(my_work_model.get("connection_pool", dict()).get("pool_size", 0))
+
+def init_edge_policies(my_work_model, app):
+    # hedging and retry policies of the calls to the external services, by service
+    global edge_policies
+    params = my_work_model.get("edge_policies", dict())
+    app.logger.info("Init edge policies: %s" % params)
+    edge_policies = EdgePolicies(params)
+
+def init_request_coalescer(my_work_model, app):
+    # single-flight coalescing of identical calls to the external services, disabled without the key
+    global request_coalescer
+    if "request_coalescing" not in my_work_model:
+        return
+    params = jsonmerge.merge({"services": None, "headers": ["x-requesttype"]}, my_work_model["request_coalescing"])
+    app.logger.info("Init request coalescer: %s" % params)
+    request_coalescer = RequestCoalescer(params)
+
+def init_call_batching(my_work_model, app):
+    # batch requests to the batch endpoint of the external services, disabled without the key
+    global call_batcher
+    if "batching" not in my_work_model:
+        return
+    default_params = {"services": None, "max_batch_size": 16, "min_batch_size": 2}
+    params = jsonmerge.merge(default_params, my_work_model["batching"])
+    app.logger.info("Init call batching: %s" % params)
+    call_batcher = CallBatcher(params)
+
+def init_h2c_clients(workmodel, transport_params, app):
+    # h2c sessions for the external services whose transport is h2c, HTTP/1.1 pools for the others
+    global h2c_clients
+    services = h2c_services(workmodel)
+    app.logger.info("Init h2c clients of %s: %s" % (services, transport_params))
+    h2c_clients = H2cClients(services, transport_params)
+
+def init_local_sockets(workmodel, my_work_model, app):
+    # Unix sockets of the local replicas of the external services that listen on them
+    global local_sockets
+    services = unix_socket_services(workmodel)
+    if len(services) == 0:
+        return
+    default_params = {"refresh_s": 1, "retry_s": 5}
+    params = jsonmerge.merge(default_params, my_work_model.get("unix_socket", dict()))
+    app.logger.info("Init local sockets of %s: %s" % (services, params))
+    local_sockets = LocalSockets(services, params)
+
+def get_session(service, service_urls):
+    if h2c_clients is not None and h2c_clients.uses_h2c(service):
+        return h2c_clients.get_session(service)
+    if local_sockets is not None and local_sockets.uses_uds(service):
+        return FallbackSession(service, local_sockets, connection_pools.get_unix_session, connection_pools.get_session(service, service_urls))
+    return connection_pools.get_session(service, service_urls)
+
+async def close_async_sessions():
+    if h2c_clients is not None:
+        await h2c_clients.close_async()
+    for unix_session in unix_async_sessions.values():
+        await unix_session.close()
+
+def is_success(r):
+    if type(r.status_code) == bool:
+        return r.status_code
+    return r.status_code == 200
 
 def init_REST(app):
     app.logger.info("Init REST function")
@@ -32,81 +165,124 @@ def init_gRPC(my_service_mesh, workmodel, server_port, app):
             # bind the client and the server
             service_stub[service] = pb2_grpc.MicroServiceStub(channel)
 
-def request_REST(service,id,work_model,s,trace,query_string, app, jaeger_context):
-    try:
-        app.logger.error(jaeger_context)
-        service_no_escape = service.split("__")[0]
-        if len(trace)==0 and len(query_string)==0:
-            # default
-            return s.get(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}', headers=jaeger_context)
-        elif len(trace)>0:
-            # trace-driven request
+def build_REST_request(service,id,service_urls,trace,query_string,jaeger_context):
+    # returns (method, url, data, headers) of the request to the external service, None if the request is invalid
+    service_no_escape = service.split("__")[0]
+    url = service_urls[service_no_escape]
+    if len(trace)==0 and len(query_string)==0:
+        # default
+        return "GET", url, None, jaeger_context
+    elif len(trace)>0:
+        # trace-driven request
+        subtree = trace[id][service]
+        if isinstance(subtree, memoryview):
+            # binary trace, the subtree is the encoded node of the service and is forwarded as is
+            headers = {'Content-type': TRACE_CONTENT_TYPE, 'Accept': 'text/plain'}
+            json_payload = subtree.tobytes()
+        else:
             headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-            headers.update(jaeger_context)
             json_dict = dict()
-            json_dict[service] = trace[id][service]
+            json_dict[service] = subtree
             json_payload = json.dumps(json_dict)
-            if  len(query_string)==0:
-                return s.post(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}',data=json_payload,headers=headers)
-            else:
-                return s.post(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}?{query_string}',data=json_payload,headers=headers)
-        elif  len(query_string)>0:
-            # request with enclosed behaviour information
-            return s.get(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}?{query_string}', headers=jaeger_context)  
+        headers.update(jaeger_context)
+        if  len(query_string)==0:
+            return "POST", url, json_payload, headers
         else:
+            return "POST", f'{url}?{query_string}', json_payload, headers
+    elif  len(query_string)>0:
+        # request with enclosed behaviour information
+        return "GET", f'{url}?{query_string}', None, jaeger_context
+    else:
+        return None
+
+def request_REST(service,id,service_urls,s,trace,query_string, app, jaeger_context, timeout=None):
+    try:
+        app.logger.error(jaeger_context)
+        rest_request = build_REST_request(service,id,service_urls,trace,query_string,jaeger_context)
+        if rest_request is None:
             r = requests.Response()
             r.status_code = 505
             return r
+        method, url, data, headers = rest_request
+        return s.request(method, url, data=data, headers=headers, timeout=timeout)
+    except (requests.exceptions.Timeout,) + TIMEOUT_ERRORS as err:
+        app.logger.error("Timeout in request external service %s -- %s" % (service, str(err)))
+        r = requests.Response()
+        r.status_code = 504
+        return r
     except Exception as err:
         app.logger.error("Error in request external service %s -- %s" % (service, str(err)))
         r = requests.Response()
         r.status_code = 505
         return r
 
-def request_gRPC(service,id,work_model,s,trace,query_string,app, trace_context=None):
+def hedge_on_new_connection(service):
+    # hedged REST calls over TCP get a new connection, so that kube-proxy may route them to another
+    # replica than the kept-alive connections of the pool; h2c and Unix socket calls keep their channel
+    if h2c_clients is not None and h2c_clients.uses_h2c(service):
+        return False
+    return local_sockets is None or not local_sockets.uses_uds(service)
+
+def request_REST_new_connection(service,id,service_urls,trace,query_string, app, jaeger_context, timeout=None):
+    # one-shot session, its connection is closed after the call
+    with requests.Session() as s:
+        s.headers["Connection"] = "close"
+        return request_REST(service,id,service_urls,s,trace,query_string, app, jaeger_context, timeout)
+
+def request_gRPC(service,id,service_urls,s,trace,query_string,app, trace_context=None, timeout=None):
     message = pb2.Message(message=f"Hello service: {service}")
     # app.logger.info(f'{message}')
-    response = service_stub[service].GetMicroServiceResponse(message)
+    response = service_stub[service].GetMicroServiceResponse(message, timeout=timeout)
     return response
 
 
-def external_service(group,id,work_model,trace,query_string, app, trace_context):
+def drop_expired(services, service_error_dict, app):
+    # services that are not called because the deadline of the request has passed
+    drop("expired", len(services))
+    for service in services:
+        service_error_dict[service] = DeadlineExceededError(f"Deadline exceeded before calling {service}")
+    app.logger.error("Deadline exceeded, dropped calls to %s" % services)
+
+
+def external_service(group,id,service_urls,trace,query_string, app, trace_context, deadline=None, services=None):
     app.logger.info("**** Start SERVICES in thread: %s" % str(group))
     global request_function
-    if group["seq_len"] < len(group["services"]):
-        # Randomly select seq_len elements from services in the group
-        selected_services = random.sample(group["services"], k=group["seq_len"])
-    else:
-        selected_services = group["services"]
-
-    # read probabilities of services of the group, if exist
-    if "probabilities" in  group.keys():
-        probabilities = group["probabilities"]
-    else:
-        probabilities = dict()
-    
     service_error_dict = dict()
     service_error_flag = False
 
-    for service in selected_services:
-        # sleep_time = random.randint(2, 5)
-        # app.logger.info("**** Service: %s -- Sleep for %d" % (service, sleep_time))
-        # time.sleep(sleep_time)
+    if services is None:
+        services = select_services(group)
+    for i, service in enumerate(services):
+        if expired(deadline):
+            drop_expired(services[i:], service_error_dict, app)
+            service_error_flag = True
+            break
         try:
-            # "url": "http://s0.default.svc.cluster.local",
-            # "path": "/api/v1",
-            if service in probabilities.keys():
-                p = probabilities[service]
+            s = get_session(service.split("__")[0], service_urls) if request_function == request_REST else None
+            # the loop variables are bound as defaults, the headers and timeout are computed at each attempt
+            call = lambda service=service, s=s: request_function(service,id,service_urls,s,trace,query_string, app, deadline_headers(trace_context, deadline), call_timeout(deadline))
+            policy = edge_policies.get(service.split("__")[0])
+            hedge_call = lambda service=service: request_REST_new_connection(service,id,service_urls,trace,query_string, app, deadline_headers(trace_context, deadline), call_timeout(deadline))
+            if request_function != request_REST or not hedge_on_new_connection(service.split("__")[0]):
+                hedge_call = None
+            policy_call = call if policy is None else lambda policy=policy, call=call, hedge_call=hedge_call: call_with_policy(policy, call, is_success, fan_out_executor.submit_if_idle, deadline, hedge_call)
+            key = request_coalescer.key(service, trace, query_string, trace_context) if request_coalescer is not None else None
+            if key is None:
+                r = policy_call()
             else:
-                p = 1
-            if random.random() < p :
-                # service called with probability p
-                r = request_function(service,id,work_model,s,trace,query_string, app, trace_context)
-                app.logger.info("Service: %s -> Status_code: %s -- len(text): %d" % (service, r.status_code, len(r.text)))
-                if type(r.status_code) == bool and not r.status_code:
-                    raise Exception(f"Error in external service: {service} -- (gRPC) status_code: {r.status_code}")
-                elif type(r.status_code) == int and r.status_code != 200:
-                    raise Exception(f"Error in external service: {service} -- (REST) status_code: {r.status_code}")
+                try:
+                    r = request_coalescer.call(key, policy_call, remaining(deadline))
+                except TimeoutError:
+                    drop("timeout")
+                    raise DeadlineExceededError(f"Deadline exceeded waiting for a coalesced call to: {service}")
+            app.logger.info("Service: %s -> Status_code: %s -- len(text): %d" % (service, r.status_code, len(r.text)))
+            if r.status_code == 504:
+                drop("timeout")
+                raise DeadlineExceededError(f"Deadline exceeded in external service: {service}")
+            if type(r.status_code) == bool and not r.status_code:
+                raise Exception(f"Error in external service: {service} -- (gRPC) status_code: {r.status_code}")
+            elif type(r.status_code) == int and r.status_code != 200:
+                raise Exception(f"Error in external service: {service} -- (REST) status_code: {r.status_code}")
 
         except Exception as err:
             service_error_dict[service] = err
@@ -117,20 +293,222 @@ def external_service(group,id,work_model,trace,query_string, app, trace_context)
     return service_error_flag, service_error_dict
 
 
-def run_external_service(services_group, work_model, query_string, trace, app, trace_context=None):
+def batch_errors(calls, statuses):
+    # errors of the calls of a batch, by service name
+    service_error_dict = dict()
+    for (id, name), status_code in zip(calls, statuses):
+        if status_code == 504:
+            drop("timeout")
+            service_error_dict[name] = DeadlineExceededError(f"Deadline exceeded in external service: {name}")
+        elif status_code != 200:
+            service_error_dict[name] = Exception(f"Error in external service: {name} -- (REST batch) status_code: {status_code}")
+    return service_error_dict
+
+
+def batched_external_service(service, calls, service_urls, trace, query_string, app, trace_context, deadline=None):
+    # calls of a request to the same external service, sent as one batch request
+    app.logger.info("**** Start BATCH of %d calls to %s in thread" % (len(calls), service))
+    if expired(deadline):
+        service_error_dict = dict()
+        drop_expired([name for _, name in calls], service_error_dict, app)
+        return True, service_error_dict
+    headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
+    headers.update(deadline_headers(trace_context, deadline))
+    data = json.dumps(call_batcher.request_body(calls, trace, query_string))
+    try:
+        s = get_session(service, service_urls)
+        r = s.post(service_urls[service] + BATCH_PATH, data=data, headers=headers, timeout=call_timeout(deadline))
+        call_batcher.sent(service, calls)
+        statuses = batch_statuses(r.status_code, r.json() if r.status_code == 200 else None, calls)
+    except (requests.exceptions.Timeout,) + TIMEOUT_ERRORS as err:
+        app.logger.error("Timeout in batch request to external service %s -- %s" % (service, str(err)))
+        statuses = [504] * len(calls)
+    except Exception as err:
+        app.logger.error("Error in batch request to external service %s -- %s" % (service, str(err)))
+        statuses = [505] * len(calls)
+    service_error_dict = batch_errors(calls, statuses)
+    app.logger.info("#### BATCH Done!")
+    return len(service_error_dict) > 0, service_error_dict
+
+
+def run_external_service(services_group, service_urls, query_string, trace, app, trace_context=None, deadline=None):
     
     app.logger.info("** EXTERNAL SERVICES")
     service_error_dict = dict()
-    number_of_groups = len(services_group)
-    pool = ThreadPoolExecutor(number_of_groups)
-    futures = list()
+    futures = dict()
+    selected = [None] * len(services_group)
+    if call_batcher is not None and request_function == request_REST:
+        # calls to the same service are taken out of their groups and sent as batches
+        batches, selected = call_batcher.partition([select_services(group) for group in services_group])
+        for service, calls in batches:
+            futures[fan_out_executor.submit(batched_external_service, service, calls, service_urls, trace, query_string, app, trace_context, deadline)] = [name for _, name in calls]
     id = 0
     for group in services_group:
-        futures.append(pool.submit(external_service, group, id, work_model, trace, query_string, app, trace_context))
+        futures[fan_out_executor.submit(external_service, group, id, service_urls, trace, query_string, app, trace_context, deadline, selected[id])] = group.services
         id = id + 1
-    wait(futures)
-    for x in as_completed(futures):
-        if x.result()[0]:
-            service_error_dict.update(x.result()[1])
+    try:
+        for x in as_completed(futures, timeout=remaining(deadline)):
+            try:
+                service_error_flag, group_error_dict = x.result()
+            except FanOutRejectedError as err:
+                service_error_flag = True
+                group_error_dict = {service: err for service in futures[x]}
+            if service_error_flag:
+                service_error_dict.update(group_error_dict)
+    except TimeoutError:
+        # groups still queued or running are not waited for, they skip their calls by themselves
+        for x, services in futures.items():
+            if not x.done():
+                service_error_dict.update({service: DeadlineExceededError("Deadline exceeded") for service in services})
     app.logger.info("--------> Threads Done!")
-    return service_error_dict
\ No newline at end of file
+    return service_error_dict
+
+
+def new_async_session():
+    # aiohttp counterpart of the connection pools, used by the asyncio engine
+    params = connection_pools.params
+    connector_params = {"limit": 0, "limit_per_host": async_limit_per_host}
+    if not params["keep_alive"]:
+        connector_params["force_close"] = True
+    elif params["idle_timeout"] is not None:
+        connector_params["keepalive_timeout"] = float(params["idle_timeout"])
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(**connector_params))
+
+
+async def request_async(service, session, method, url, data, headers, timeout=None):
+    # returns (status_code, body) of a call, over h2c, the Unix socket of a local replica or TCP
+    if h2c_clients is not None and h2c_clients.uses_h2c(service):
+        return await h2c_clients.get_async_session(service).request(method, url, data=data, headers=headers, timeout=timeout)
+    timeout_params = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout is not None else dict()
+    socket_path = local_sockets.local_socket(service) if local_sockets is not None else None
+    if socket_path is not None:
+        if socket_path not in unix_async_sessions:
+            unix_async_sessions[socket_path] = aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=socket_path))
+        start = time.monotonic()
+        try:
+            async with unix_async_sessions[socket_path].request(method, url, data=data, headers=headers, **timeout_params) as r:
+                result = r.status, await r.read()
+            observe(service, "uds", start)
+            return result
+        except aiohttp.ClientConnectorError:
+            local_sockets.failed(service, socket_path)
+    start = time.monotonic()
+    async with session.request(method, url, data=data, headers=headers, **timeout_params) as r:
+        result = r.status, await r.read()
+    if local_sockets is not None and local_sockets.uses_uds(service):
+        observe(service, "tcp", start)
+    return result
+
+
+async def request_REST_async(service,id,service_urls,session,trace,query_string,app,jaeger_context,timeout=None):
+    # returns (status_code, body) of the call to the external service
+    try:
+        rest_request = build_REST_request(service,id,service_urls,trace,query_string,jaeger_context)
+        if rest_request is None:
+            return 505, b""
+        method, url, data, headers = rest_request
+        return await request_async(service.split("__")[0], session, method, url, data, headers, timeout)
+    except (asyncio.TimeoutError,) + TIMEOUT_ERRORS as err:
+        app.logger.error("Timeout in request external service %s -- %s" % (service, str(err)))
+        return 504, b""
+    except Exception as err:
+        app.logger.error("Error in request external service %s -- %s" % (service, str(err)))
+        return 505, b""
+
+
+async def request_REST_async_new_connection(service,id,service_urls,trace,query_string,app,jaeger_context,timeout=None):
+    # one-shot session, its connection is closed after the call
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as session:
+        return await request_REST_async(service,id,service_urls,session,trace,query_string,app,jaeger_context,timeout)
+
+
+async def external_service_async(group,id,service_urls,trace,query_string,app,session,trace_context,deadline=None,services=None):
+    app.logger.info("**** Start SERVICES in task: %s" % str(group))
+    service_error_dict = dict()
+    service_error_flag = False
+
+    if services is None:
+        services = select_services(group)
+    for i, service in enumerate(services):
+        if expired(deadline):
+            drop_expired(services[i:], service_error_dict, app)
+            service_error_flag = True
+            break
+        try:
+            # the loop variables are bound as defaults, the headers and timeout are computed at each attempt
+            call = lambda service=service: request_REST_async(service,id,service_urls,session,trace,query_string,app,deadline_headers(trace_context, deadline),call_timeout(deadline))
+            policy = edge_policies.get(service.split("__")[0])
+            hedge_call = lambda service=service: request_REST_async_new_connection(service,id,service_urls,trace,query_string,app,deadline_headers(trace_context, deadline),call_timeout(deadline))
+            if not hedge_on_new_connection(service.split("__")[0]):
+                hedge_call = None
+            policy_call = call if policy is None else lambda policy=policy, call=call, hedge_call=hedge_call: call_with_policy_async(policy, call, lambda result: result[0] == 200, deadline, hedge_call)
+            key = request_coalescer.key(service, trace, query_string, trace_context) if request_coalescer is not None else None
+            if key is None:
+                status_code, body = await policy_call()
+            else:
+                try:
+                    status_code, body = await request_coalescer.call_async(key, policy_call, remaining(deadline))
+                except asyncio.TimeoutError:
+                    drop("timeout")
+                    raise DeadlineExceededError(f"Deadline exceeded waiting for a coalesced call to: {service}")
+            app.logger.info("Service: %s -> Status_code: %s -- len(text): %d" % (service, status_code, len(body)))
+            if status_code == 504:
+                drop("timeout")
+                raise DeadlineExceededError(f"Deadline exceeded in external service: {service}")
+            if status_code != 200:
+                raise Exception(f"Error in external service: {service} -- (REST) status_code: {status_code}")
+
+        except Exception as err:
+            service_error_dict[service] = err
+            service_error_flag = True
+            app.logger.error("Error in request external service %s -- %s" % (service, str(err)))
+
+    app.logger.info("#### SERVICE Done!")
+    return service_error_flag, service_error_dict
+
+
+async def batched_external_service_async(service, calls, service_urls, trace, query_string, app, session, trace_context, deadline=None):
+    # asyncio counterpart of batched_external_service
+    app.logger.info("**** Start BATCH of %d calls to %s in task" % (len(calls), service))
+    if expired(deadline):
+        service_error_dict = dict()
+        drop_expired([name for _, name in calls], service_error_dict, app)
+        return True, service_error_dict
+    headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
+    headers.update(deadline_headers(trace_context, deadline))
+    data = json.dumps(call_batcher.request_body(calls, trace, query_string))
+    try:
+        status_code, body = await request_async(service, session, "POST", service_urls[service] + BATCH_PATH, data, headers, call_timeout(deadline))
+        call_batcher.sent(service, calls)
+        statuses = batch_statuses(status_code, json.loads(body) if status_code == 200 else None, calls)
+    except (asyncio.TimeoutError,) + TIMEOUT_ERRORS as err:
+        app.logger.error("Timeout in batch request to external service %s -- %s" % (service, str(err)))
+        statuses = [504] * len(calls)
+    except Exception as err:
+        app.logger.error("Error in batch request to external service %s -- %s" % (service, str(err)))
+        statuses = [505] * len(calls)
+    service_error_dict = batch_errors(calls, statuses)
+    app.logger.info("#### BATCH Done!")
+    return len(service_error_dict) > 0, service_error_dict
+
+
+async def run_external_service_async(services_group, service_urls, query_string, trace, app, session: aiohttp.ClientSession, trace_context=None, deadline=None):
+    # groups run concurrently as tasks of the event loop instead of threads
+    app.logger.info("** EXTERNAL SERVICES")
+    service_error_dict = dict()
+    selected = [None] * len(services_group)
+    batches = list()
+    if call_batcher is not None:
+        batches, selected = call_batcher.partition([select_services(group) for group in services_group])
+    results = await asyncio.gather(*[
+        batched_external_service_async(service, calls, service_urls, trace, query_string, app, session, trace_context, deadline)
+        for service, calls in batches
+    ], *[
+        external_service_async(group, id, service_urls, trace, query_string, app, session, trace_context, deadline, selected[id])
+        for id, group in enumerate(services_group)
+    ])
+    for service_error_flag, group_error_dict in results:
+        if service_error_flag:
+            service_error_dict.update(group_error_dict)
+    app.logger.info("--------> Tasks Done!")
+    return service_error_dict
@@ -0,0 +1,143 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from prometheus_client import Counter, Gauge
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+SATURATION_POLICIES = ("queue", "reject", "inline")
+
+FAN_OUT_QUEUE_DEPTH = Gauge(
+    "mub_fan_out_queue_depth",
+    "External service groups waiting for a fan-out thread",
+    ["zone", "app_name"],
+    multiprocess_mode="livesum",
+)
+FAN_OUT_IN_FLIGHT = Gauge(
+    "mub_fan_out_in_flight",
+    "External service groups submitted to the fan-out executor and not completed yet",
+    ["zone", "app_name"],
+    multiprocess_mode="livesum",
+)
+FAN_OUT_SATURATED = Counter(
+    "mub_fan_out_saturated",
+    "External service groups submitted while the fan-out executor was saturated",
+    ["zone", "app_name", "policy"],
+)
+
+
+class FanOutRejectedError(Exception):
+    """Raised for groups rejected by a saturated fan-out executor."""
+
+
+class FanOutExecutor:
+    """
+    Long-lived, bounded thread pool used to call the external service groups in parallel.
+    When `max_workers + max_queue_size` groups are in flight, the executor is saturated and
+    new groups are queued anyway ("queue"), rejected ("reject") or run by the caller ("inline").
+    `hedge_workers` more threads are kept for the calls of submit_if_idle (e.g., hedged calls),
+    so that they still find idle threads when the groups keep the pool busy.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        saturation_policy: str = "queue",
+        max_queue_size: int = 0,
+        hedge_workers: int = 0,
+    ):
+        if saturation_policy not in SATURATION_POLICIES:
+            raise ValueError(f"Unsupported saturation policy: {saturation_policy}")
+        self.max_workers = max(1, int(max_workers))
+        self.saturation_policy = saturation_policy
+        self.max_queue_size = max(0, int(max_queue_size))
+        self.hedge_workers = max(0, int(hedge_workers))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._hedge_in_flight = 0
+        self._pool = None
+        self._pool_pid = None
+        self._hedge_pool = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # The pool is created lazily so that every gunicorn worker gets its own threads after the fork.
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(self.max_workers)
+            self._hedge_pool = ThreadPoolExecutor(self.hedge_workers) if self.hedge_workers > 0 else None
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run_reserved(self, fn: Callable, args: tuple):
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._hedge_in_flight -= 1
+
+    def _run(self, fn: Callable, args: tuple):
+        FAN_OUT_QUEUE_DEPTH.labels(ZONE, K8S_APP).dec()
+        try:
+            return fn(*args)
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._lock:
+            self._in_flight -= 1
+        FAN_OUT_IN_FLIGHT.labels(ZONE, K8S_APP).dec()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            saturated = self._in_flight >= self.max_workers + self.max_queue_size
+            if saturated and self.saturation_policy == "reject":
+                accepted = False
+            else:
+                accepted = True
+                self._in_flight += 1
+        if saturated:
+            FAN_OUT_SATURATED.labels(ZONE, K8S_APP, self.saturation_policy).inc()
+        if not accepted:
+            future = Future()
+            future.set_exception(
+                FanOutRejectedError(
+                    f"Fan-out executor saturated ({self._in_flight} groups in flight)"
+                )
+            )
+            return future
+
+        FAN_OUT_IN_FLIGHT.labels(ZONE, K8S_APP).inc()
+        if saturated and self.saturation_policy == "inline":
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as err:
+                future.set_exception(err)
+            finally:
+                self._done()
+            return future
+
+        FAN_OUT_QUEUE_DEPTH.labels(ZONE, K8S_APP).inc()
+        return self._get_pool().submit(self._run, fn, args)
+
+    def submit_if_idle(self, fn: Callable, *args) -> Optional[Future]:
+        """
+        Submits fn only if a reserved thread, or else a thread of the pool, is idle,
+        returns None otherwise (e.g., for hedged calls).
+        """
+        with self._lock:
+            reserved = self._hedge_in_flight < self.hedge_workers
+            if reserved:
+                self._hedge_in_flight += 1
+            elif self._in_flight >= self.max_workers:
+                return None
+            else:
+                self._in_flight += 1
+        if reserved:
+            self._get_pool()  # creates the reserved threads of this process too
+            return self._hedge_pool.submit(self._run_reserved, fn, args)
+        FAN_OUT_IN_FLIGHT.labels(ZONE, K8S_APP).inc()
+        FAN_OUT_QUEUE_DEPTH.labels(ZONE, K8S_APP).inc()
+        return self._get_pool().submit(self._run, fn, args)
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from prometheus_client import Counter, Gauge
+
+# optional dependencies, only needed by the services using the h2c transport
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    from hypercorn.asyncio.run import worker_serve
+    from hypercorn.config import Config as HypercornConfig
+    from hypercorn.utils import wrap_app
+except ImportError:
+    HypercornConfig = None
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+# "http1" serves and calls with HTTP/1.1, "h2c" with cleartext HTTP/2 (prior knowledge)
+PROTOCOLS = ("http1", "h2c")
+
+# timeouts of the h2c calls, caught together with the ones of requests
+TIMEOUT_ERRORS = (httpx.TimeoutException,) if httpx is not None else ()
+
+H2C_STREAMS = Counter(
+    "mub_h2c_streams",
+    "Calls to external services sent as HTTP/2 streams",
+    ["zone", "app_name", "service"],
+)
+H2C_STREAMS_IN_FLIGHT = Gauge(
+    "mub_h2c_streams_in_flight",
+    "HTTP/2 streams in flight towards external services, summed over the workers",
+    ["zone", "app_name", "service"],
+    multiprocess_mode="livesum",
+)
+H2C_CONNECTIONS = Gauge(
+    "mub_h2c_connections",
+    "HTTP/2 connections open towards external services, summed over the workers",
+    ["zone", "app_name", "service"],
+    multiprocess_mode="livesum",
+)
+SERVER_REQUESTS = Counter(
+    "mub_server_requests",
+    "Requests received by the h2c server, by HTTP protocol version",
+    ["zone", "app_name", "protocol"],
+)
+
+
+def h2c_services(work_model: dict) -> set:
+    # external services that accept h2c, according to their own transport
+    return {
+        service
+        for service, service_model in work_model.items()
+        if service_model.get("transport", dict()).get("protocol") == "h2c"
+    }
+
+
+def _pool_connections(transport) -> int:
+    # connections of the httpcore pool of an httpx transport, not exposed by httpx
+    return len(getattr(getattr(transport, "_pool", None), "connections", ()))
+
+
+class H2cSession:
+    """
+    requests.Session-like client of an h2c external service: its calls are streams multiplexed
+    over at most `connections` HTTP/2 connections of the worker.
+    """
+
+    def __init__(self, service: str, connections: int):
+        self.service = service
+        self._transport = httpx.HTTPTransport(
+            http1=False,
+            http2=True,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+        )
+        self._client = httpx.Client(transport=self._transport)
+        self._in_flight = H2C_STREAMS_IN_FLIGHT.labels(ZONE, K8S_APP, service)
+        self._connections = H2C_CONNECTIONS.labels(ZONE, K8S_APP, service)
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        H2C_STREAMS.labels(ZONE, K8S_APP, self.service).inc()
+        self._in_flight.inc()
+        try:
+            # unlike requests, httpx defaults to a 5 s timeout, so None is passed explicitly
+            return self._client.request(method, url, content=data, headers=headers, timeout=timeout)
+        finally:
+            self._in_flight.dec()
+            self._connections.set(_pool_connections(self._transport))
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+class AsyncH2cSession:
+    """asyncio counterpart of H2cSession, returns (status, body) like request_REST_async."""
+
+    def __init__(self, service: str, connections: int):
+        self.service = service
+        self._transport = httpx.AsyncHTTPTransport(
+            http1=False,
+            http2=True,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+        )
+        self._client = httpx.AsyncClient(transport=self._transport)
+        self._in_flight = H2C_STREAMS_IN_FLIGHT.labels(ZONE, K8S_APP, service)
+        self._connections = H2C_CONNECTIONS.labels(ZONE, K8S_APP, service)
+
+    async def request(self, method, url, data=None, headers=None, timeout=None):
+        H2C_STREAMS.labels(ZONE, K8S_APP, self.service).inc()
+        self._in_flight.inc()
+        try:
+            r = await self._client.request(
+                method, url, content=data, headers=headers, timeout=timeout
+            )
+            return r.status_code, r.content
+        finally:
+            self._in_flight.dec()
+            self._connections.set(_pool_connections(self._transport))
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class H2cClients:
+    """Sessions of the h2c external services, created by each worker after the fork."""
+
+    def __init__(self, services: set, params: dict):
+        if len(services) > 0 and httpx is None:
+            raise RuntimeError("The h2c transport requires httpx[http2]")
+        self.services = services
+        self.connections = max(1, int(params["connections"]))
+        self._sessions = dict()
+        self._async_sessions = dict()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def uses_h2c(self, service: str) -> bool:
+        return service in self.services
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._sessions, self._async_sessions = dict(), dict()
+            self._pid = os.getpid()
+
+    def get_session(self, service: str) -> H2cSession:
+        with self._lock:
+            self._check_pid()
+            if service not in self._sessions:
+                self._sessions[service] = H2cSession(service, self.connections)
+            return self._sessions[service]
+
+    def get_async_session(self, service: str) -> AsyncH2cSession:
+        # the event loop of the worker is single-threaded
+        self._check_pid()
+        if service not in self._async_sessions:
+            self._async_sessions[service] = AsyncH2cSession(service, self.connections)
+        return self._async_sessions[service]
+
+    async def close_async(self):
+        for session in self._async_sessions.values():
+            await session.close()
+
+
+def _counting(wsgi_app):
+    def counted(environ, start_response):
+        SERVER_REQUESTS.labels(ZONE, K8S_APP, environ.get("SERVER_PROTOCOL", "")).inc()
+        return wsgi_app(environ, start_response)
+
+    return counted
+
+
+def _run_worker(wsgi_app, config, sockets, threads: int, on_worker_start: Optional[Callable]):
+    if on_worker_start is not None:
+        on_worker_start()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # the WSGI application runs on the default executor of the event loop
+    loop.set_default_executor(ThreadPoolExecutor(threads))
+    loop.run_until_complete(
+        worker_serve(
+            wrap_app(_counting(wsgi_app), config.wsgi_max_body_size, "wsgi"), config, sockets=sockets
+        )
+    )
+
+
+def serve_h2c(
+    wsgi_app,
+    binds: list,
+    workers: int,
+    threads: int,
+    params: dict,
+    on_worker_start: Optional[Callable] = None,
+    on_worker_exit: Optional[Callable[[int], None]] = None,
+):
+    """
+    Serves a WSGI application with Hypercorn, which accepts both HTTP/1.1 and h2c on the same port.
+    Like Gunicorn, the master binds the socket and forks `workers` processes, each serving
+    the requests on `threads` threads, with at most `max_streams` concurrent streams per connection.
+    """
+    if HypercornConfig is None:
+        raise RuntimeError("The h2c transport requires hypercorn")
+    config = HypercornConfig()
+    config.bind = binds
+    config.h2_max_concurrent_streams = int(params["max_streams"])
+    sockets = config.create_sockets()
+    pids = list()
+    for _ in range(int(workers)):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(wsgi_app, config, sockets, int(threads), on_worker_start)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+
+    def stop(signum, frame):
+        for pid in pids:
+            os.kill(pid, signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in pids:
+        os.waitpid(pid, 0)
+        if on_worker_exit is not None:
+            on_worker_exit(pid)
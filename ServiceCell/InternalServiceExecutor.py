@@ -1,18 +1,43 @@
 from readline import append_history_file
 import logging
 import threading
+import asyncio
 import os
 import glob
 import random
+import time
 import jsonmerge
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple, Tuple
+from prometheus_client import Summary
+from PayloadArena import get_payload
 
 
 LOGLEVEL = os.environ.get("LOGLEVEL", "INFO").upper()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-internal_service_function = None
-internal_service_params_v = None
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+# "inline" runs the function in the request thread, "spawn" in a new thread per request,
+# "thread" and "process" in a persistent pool of the worker process.
+EXECUTOR_STRATEGIES = ("inline", "spawn", "thread", "process")
+executor_strategy = "inline"
+executor_pool_size = 1
+executor_pool = None
+executor_pool_pid = None
+
+INTERNAL_FUNCTION_LATENCY = Summary(
+    "mub_internal_function_latency_seconds",
+    "Latency of the internal service function, excluding the executor",
+    ["zone", "app_name", "strategy"],
+)
+INTERNAL_EXECUTOR_OVERHEAD = Summary(
+    "mub_internal_executor_overhead_seconds",
+    "Latency added by the executor of the internal service function",
+    ["zone", "app_name", "strategy"],
+)
 
 # Dinamyc import of all function in InternalServiceFunctions folder
 for path in glob.glob("MSConfig/InternalServiceFunctions/[!_]*.py"):
@@ -28,7 +53,7 @@ class InternalServiceExecutor(threading.Thread):
         self.response = response
 
     def run(self):
-        self.response.set_body(self.internal_service_function(self.params))
+        self.response.set_body(self.internal_service_function(*self.params))
         # self.response.set_body(eval(self.internal_service_function))
 
 
@@ -82,39 +107,144 @@ def compute_pi(params):
 
     bandwidth_load = random.expovariate(1 / params["mean_bandwidth"])
     num_chars = max(1, 1000 * bandwidth_load)  # Response in kB
-    response_body = "m" * int(num_chars)
+    response_body = get_payload(int(num_chars))
 
     return response_body
 
 
-def set_internal_service_function(internal_service_params):
-    global internal_service_function, internal_service_params_v
-    # HACK: this [0] refers to the "loader" field; it just picks the first key.
+class InternalService(NamedTuple):
+    function: Callable
+    params: dict
+
+
+def resolve_internal_service(internal_service_params: dict) -> InternalService:
+    # An empty internal service runs the loader with its default parameters.
     function_name = (
         "loader"
         if len(internal_service_params) == 0
         else list(internal_service_params)[0]
     )
-    internal_service_params_v = list(internal_service_params.values())[0]
-    internal_service_function = eval(function_name)
+    params = (
+        dict()
+        if len(internal_service_params) == 0
+        else list(internal_service_params.values())[0]
+    )
     logger.info(
-        'Setting internal service function: "{func}"'.format(func=function_name)
+        'Resolving internal service function: "{func}"'.format(func=function_name)
+    )
+    # Functions can have a "<name>_prepare" companion that is run once per internal service
+    # at startup, before gunicorn forks the workers (e.g., loader_prepare calibrates the CPU).
+    prepare_function = globals().get(f"{function_name}_prepare")
+    if prepare_function is not None:
+        prepare_function(params)
+    return InternalService(eval(function_name), params)
+
+
+def _timed_call(function: Callable, params: dict) -> Tuple[object, float]:
+    # runs in the executor, so that its time excludes the executor overhead
+    start = time.perf_counter()
+    body = function(params)
+    return body, time.perf_counter() - start
+
+
+def _timed_call_in_process(function: Callable, params: dict) -> Tuple[object, float]:
+    # memoryview payloads cannot be pickled back to the worker process
+    body, function_time = _timed_call(function, params)
+    if isinstance(body, memoryview):
+        body = body.tobytes()
+    return body, function_time
+
+
+def init_internal_service_executor(params: dict):
+    global executor_strategy, executor_pool_size
+    if params["strategy"] not in EXECUTOR_STRATEGIES:
+        raise ValueError(f"Unsupported internal service executor: {params['strategy']}")
+    executor_strategy = params["strategy"]
+    executor_pool_size = max(1, int(params["pool_size"]))
+    logger.info("Init internal service executor: %s", params)
+
+
+def get_executor_pool():
+    # Pools are created in each worker process, after the fork of gunicorn.
+    global executor_pool, executor_pool_pid
+    if executor_strategy not in ("thread", "process"):
+        return None
+    if executor_pool is None or executor_pool_pid != os.getpid():
+        if executor_strategy == "thread":
+            executor_pool = ThreadPoolExecutor(executor_pool_size)
+        else:
+            executor_pool = ProcessPoolExecutor(executor_pool_size)
+        executor_pool_pid = os.getpid()
+    return executor_pool
+
+
+def warm_up_executor_pool():
+    # starts the threads/processes of the pool before the first request
+    pool = get_executor_pool()
+    if pool is not None:
+        wait([pool.submit(time.sleep, 0) for _ in range(executor_pool_size)])
+
+
+def init_worker_internal_services(internal_services):
+    # Functions can have a "<name>_worker_init" companion that is run in each worker process
+    # after the fork, e.g., loader_worker_init starts the pools of the CPU stress.
+    for internal_service in internal_services:
+        worker_init_function = globals().get(f"{internal_service.function.__name__}_worker_init")
+        if worker_init_function is not None:
+            worker_init_function(internal_service.params)
+
+
+def _observe_executor_latency(total_time: float, function_time: float, strategy: str = None):
+    strategy = strategy or executor_strategy
+    INTERNAL_FUNCTION_LATENCY.labels(ZONE, K8S_APP, strategy).observe(function_time)
+    INTERNAL_EXECUTOR_OVERHEAD.labels(ZONE, K8S_APP, strategy).observe(
+        max(0.0, total_time - function_time)
     )
 
 
-def run_internal_service(internal_service_params):
-    global internal_service_function, internal_service_params_v
-    if internal_service_function == None:
-        set_internal_service_function(internal_service_params)
-    logger.info(internal_service_function)
-    # function_name = list(internal_service_params)[0]
-    # internal_service_params_v = list(internal_service_params.values())[0]
-    # response = list()
-    # response = dict()
-    response = ThreadReturnedValue()
-    thread = InternalServiceExecutor(
-        internal_service_function, internal_service_params_v, response
+def run_internal_service(internal_service: InternalService):
+    start = time.perf_counter()
+    if executor_strategy == "inline":
+        body, function_time = _timed_call(
+            internal_service.function, internal_service.params
+        )
+    elif executor_strategy == "spawn":
+        # a new thread per request
+        response = ThreadReturnedValue()
+        thread = InternalServiceExecutor(_timed_call, internal_service, response)
+        thread.start()
+        thread.join()
+        body, function_time = response.get_body()
+    else:
+        timed_call = _timed_call_in_process if executor_strategy == "process" else _timed_call
+        body, function_time = (
+            get_executor_pool()
+            .submit(timed_call, internal_service.function, internal_service.params)
+            .result()
+        )
+    _observe_executor_latency(time.perf_counter() - start, function_time)
+    return body
+
+
+async def run_internal_service_async(internal_service: InternalService, executor=None):
+    # Functions with an "<name>_async" coroutine companion (e.g., loader_async) are awaited directly,
+    # any other function runs on the executor so that it does not block the event loop.
+    # The process strategy replaces the executor with the process pool, the other strategies use
+    # the thread pool of the engine, which labels the metrics as "engine".
+    timed_call = _timed_call
+    strategy = "engine"
+    if executor_strategy == "process":
+        executor = get_executor_pool()
+        timed_call = _timed_call_in_process
+        strategy = executor_strategy
+    else:
+        async_function = globals().get(f"{internal_service.function.__name__}_async")
+        if async_function is not None:
+            return await async_function(internal_service.params, executor)
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    body, function_time = await loop.run_in_executor(
+        executor, timed_call, internal_service.function, internal_service.params
     )
-    thread.start()
-    thread.join()
-    return response.get_body()
+    _observe_executor_latency(time.perf_counter() - start, function_time, strategy)
+    return body
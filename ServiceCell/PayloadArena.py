@@ -0,0 +1,48 @@
+import os
+import random
+import string
+import threading
+
+DEFAULT_ARENA_SIZE = 1024 * 1024  # 1 MB
+
+# maps each random byte to an ascii letter
+_LETTERS_TABLE = bytes(
+    ord(string.ascii_letters[i % len(string.ascii_letters)]) for i in range(256)
+)
+
+
+def random_letters(size: int) -> bytes:
+    return os.urandom(size).translate(_LETTERS_TABLE)
+
+
+class PayloadArena:
+    """
+    Random ascii payload generated once and served as memoryview slices
+    at random offsets, so that responses are not built byte by byte.
+    The arena grows when a larger payload is requested.
+    """
+
+    def __init__(self, size: int = DEFAULT_ARENA_SIZE):
+        self._payload = random_letters(size)
+        self._lock = threading.Lock()
+
+    def _grow(self, size: int):
+        with self._lock:
+            if len(self._payload) < size:
+                self._payload = random_letters(max(size, 2 * len(self._payload)))
+
+    def get(self, num_bytes: int) -> memoryview:
+        num_bytes = max(0, int(num_bytes))
+        if len(self._payload) < num_bytes:
+            self._grow(num_bytes)
+        payload = self._payload
+        offset = random.randint(0, len(payload) - num_bytes)
+        return memoryview(payload)[offset : offset + num_bytes]
+
+
+# created at import time, i.e., in the gunicorn master, and shared by the forked workers
+payload_arena = PayloadArena()
+
+
+def get_payload(num_bytes: int) -> memoryview:
+    return payload_arena.get(num_bytes)
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable, Mapping, Optional
+
+from prometheus_client import Counter, Summary
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+COALESCING_FLIGHTS = Counter(
+    "mub_coalescing_flights",
+    "Calls to external services sent by the request coalescer, each one shared by its waiters",
+    ["zone", "app_name", "service"],
+)
+COALESCED_CALLS = Counter(
+    "mub_coalesced_calls",
+    "Calls to external services not sent, but served by an identical call in flight",
+    ["zone", "app_name", "service"],
+)
+COALESCING_WAITERS = Summary(
+    "mub_coalescing_waiters",
+    "Number of calls served by each call sent by the request coalescer, besides its own",
+    ["zone", "app_name", "service"],
+)
+
+
+class _Flight:
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """
+    Single-flight coalescing of identical calls to external services: while a call with a given
+    key is in flight, identical calls of other requests of the worker wait for its result instead
+    of being sent. `services` lists the coalesced external services, null for all of them.
+    Calls are identical when they also forward the same values of the `headers` that change the
+    response (e.g., x-requesttype); the other headers, such as the trace context and the per-hop
+    headers of the proxies, differ at each request and are not compared.
+    """
+
+    def __init__(self, params: dict):
+        self.services = params["services"]
+        self.headers = tuple(header.lower() for header in params["headers"])
+        self._flights = dict()
+        self._lock = threading.Lock()
+        # the asyncio engine runs one event loop per worker, its flights need no lock
+        self._async_flights = dict()
+
+    def key(
+        self, service: str, trace: dict, query_string: str, headers: Optional[Mapping[str, str]] = None
+    ) -> Optional[Hashable]:
+        """Returns the key of a call, None if it is not coalesced, e.g., trace-driven calls."""
+        service = service.split("__")[0]
+        if len(trace) > 0 or (self.services is not None and service not in self.services):
+            return None
+        values = {name.lower(): value for name, value in (headers or dict()).items()}
+        return (service, query_string) + tuple(values.get(header) for header in self.headers)
+
+    def call(self, key: Hashable, call: Callable, timeout: Optional[float] = None):
+        """
+        Returns the result of `call`, or of the identical call in flight, waiting at most `timeout`
+        seconds for it (concurrent.futures.TimeoutError). Exceptions are raised to all the waiters.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(Future())
+                leader = True
+            else:
+                flight.waiters += 1
+                leader = False
+        if not leader:
+            COALESCED_CALLS.labels(ZONE, K8S_APP, key[0]).inc()
+            return flight.future.result(timeout=timeout)
+
+        COALESCING_FLIGHTS.labels(ZONE, K8S_APP, key[0]).inc()
+        try:
+            result = call()
+        except BaseException as err:
+            self._land(key, flight)
+            flight.future.set_exception(err)
+            raise
+        self._land(key, flight)
+        flight.future.set_result(result)
+        return result
+
+    def _land(self, key: Hashable, flight: _Flight):
+        # later identical calls start a new flight, the waiters of this one are then fixed
+        with self._lock:
+            del self._flights[key]
+        COALESCING_WAITERS.labels(ZONE, K8S_APP, key[0]).observe(flight.waiters)
+
+    async def call_async(
+        self, key: Hashable, call: Callable[[], Awaitable], timeout: Optional[float] = None
+    ):
+        """asyncio counterpart of call, the waiters time out with asyncio.TimeoutError."""
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            flight.waiters += 1
+            COALESCED_CALLS.labels(ZONE, K8S_APP, key[0]).inc()
+            # shielded, so that a waiter timing out does not cancel the call of the others
+            return await asyncio.wait_for(asyncio.shield(flight.future), timeout)
+
+        flight = self._async_flights[key] = _Flight(asyncio.get_event_loop().create_future())
+        COALESCING_FLIGHTS.labels(ZONE, K8S_APP, key[0]).inc()
+        try:
+            result = await call()
+        except BaseException as err:
+            del self._async_flights[key]
+            COALESCING_WAITERS.labels(ZONE, K8S_APP, key[0]).observe(flight.waiters)
+            if isinstance(err, asyncio.CancelledError):
+                err = ConnectionError(f"Coalesced call to {key[0]} cancelled")
+            flight.future.set_exception(err)
+            if flight.waiters == 0:
+                # retrieved, so that asyncio does not log it as never retrieved
+                flight.future.exception()
+            raise
+        del self._async_flights[key]
+        COALESCING_WAITERS.labels(ZONE, K8S_APP, key[0]).observe(flight.waiters)
+        flight.future.set_result(result)
+        return result
@@ -0,0 +1,177 @@
+import bisect
+import fcntl
+import hashlib
+import itertools
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from typing import Mapping, Optional
+
+from prometheus_client import Counter
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+# "query_string" and "request_type" derive the key from the request, "zipf" and "hit_ratio" draw synthetic keys.
+CACHE_KEYS = ("query_string", "request_type", "zipf", "hit_ratio")
+
+# slot header: key hash, expiration time (0 for none), last use, length of the value
+_SLOT_HEADER = struct.Struct("<QddI")
+
+CACHE_HITS = Counter("mub_cache_hits", "Requests served by the response cache", ["zone", "app_name"])
+CACHE_MISSES = Counter("mub_cache_misses", "Requests not found in the response cache", ["zone", "app_name"])
+CACHE_EVICTIONS = Counter(
+    "mub_cache_evictions",
+    "Responses evicted from the response cache, to make room or because expired",
+    ["zone", "app_name", "reason"],
+)
+
+
+class ResponseCache:
+    """
+    Set-associative cache of responses in a memory-mapped file, shared by the workers of a pod.
+    Each set of `ways` slots is protected by a lock on its byte range, and by a thread lock
+    within the process, since record locks do not exclude the threads of a process.
+    Slots are replaced LRU, and expired after `ttl_s` seconds, if not null.
+    """
+
+    def __init__(self, path: str, params: dict):
+        if params["key"] not in CACHE_KEYS:
+            raise ValueError(f"Unsupported cache key: {params['key']}")
+        self.params = params
+        self.key_mode = params["key"]
+        self.ways = max(1, int(params["ways"]))
+        self.sets = max(1, int(params["entries"]) // self.ways)
+        self.max_value_size = int(float(params["max_value_kb"]) * 1024)
+        self.slot_size = _SLOT_HEADER.size + self.max_value_size
+        self.set_size = self.ways * self.slot_size
+        self.ttl = None if params["ttl_s"] is None else float(params["ttl_s"])
+        self.path = path
+        # the file is recreated by the master, before the fork, so that stale entries are dropped
+        fd = os.open(path, os.O_CREAT | os.O_RDWR | os.O_TRUNC, 0o644)
+        os.ftruncate(fd, self.sets * self.set_size)
+        os.close(fd)
+        self._fd = None
+        self._map = None
+        self._pid = None
+        self._map_lock = threading.Lock()
+        self._set_locks = [threading.Lock() for _ in range(min(self.sets, 256))]
+        if self.key_mode == "zipf":
+            weights = [
+                1 / (rank ** float(params["zipf_s"]))
+                for rank in range(1, int(params["key_space"]) + 1)
+            ]
+            total = sum(weights)
+            self._zipf_cdf = list(itertools.accumulate(w / total for w in weights))
+
+    def _mapping(self):
+        # mapped once per worker process, by the first of its threads
+        if self._pid != os.getpid():
+            with self._map_lock:
+                if self._pid != os.getpid():
+                    self._fd = os.open(self.path, os.O_RDWR)
+                    self._map = mmap.mmap(self._fd, self.sets * self.set_size)
+                    self._pid = os.getpid()
+        return self._map
+
+    def key(self, query_string: str, headers: Mapping[str, str]) -> Optional[int]:
+        """Returns the key of a request, None for requests that are not cached."""
+        if self.key_mode == "query_string":
+            data = query_string
+        elif self.key_mode == "request_type":
+            data = str(headers.get("x-requesttype"))
+        elif self.key_mode == "zipf":
+            rank = bisect.bisect_left(self._zipf_cdf, random.random())
+            data = f"zipf-{min(rank, len(self._zipf_cdf) - 1)}"
+        else:
+            # hot keys, which fit in the cache, with probability hit_ratio, else a miss that is
+            # not cached, as its key would never be requested again
+            if random.random() >= float(self.params["hit_ratio"]):
+                return None
+            data = f"hot-{random.randrange(max(1, self.sets * self.ways // 2))}"
+        # 0 marks empty slots
+        return max(1, int.from_bytes(hashlib.blake2b(data.encode(), digest_size=8).digest(), "little"))
+
+    def _locked(self, set_index: int):
+        return _SetLock(self, set_index)
+
+    def get(self, key: Optional[int]) -> Optional[bytes]:
+        if key is None:
+            CACHE_MISSES.labels(ZONE, K8S_APP).inc()
+            return None
+        data = self._mapping()
+        set_index = key % self.sets
+        now = time.time()
+        with self._locked(set_index):
+            for way in range(self.ways):
+                offset = set_index * self.set_size + way * self.slot_size
+                slot_key, expires, _, length = _SLOT_HEADER.unpack_from(data, offset)
+                if slot_key != key:
+                    continue
+                if expires and expires < now:
+                    _SLOT_HEADER.pack_into(data, offset, 0, 0, 0, 0)
+                    CACHE_EVICTIONS.labels(ZONE, K8S_APP, "expired").inc()
+                    break
+                _SLOT_HEADER.pack_into(data, offset, slot_key, expires, now, length)
+                value = data[offset + _SLOT_HEADER.size : offset + _SLOT_HEADER.size + length]
+                CACHE_HITS.labels(ZONE, K8S_APP).inc()
+                return value
+        CACHE_MISSES.labels(ZONE, K8S_APP).inc()
+        return None
+
+    def put(self, key: Optional[int], value: bytes) -> bool:
+        if key is None or len(value) > self.max_value_size:
+            return False
+        data = self._mapping()
+        set_index = key % self.sets
+        now = time.time()
+        with self._locked(set_index):
+            # same key, else an empty or expired slot, else the least recently used one
+            victim, victim_rank = None, None
+            for way in range(self.ways):
+                offset = set_index * self.set_size + way * self.slot_size
+                slot_key, expires, last_used, _ = _SLOT_HEADER.unpack_from(data, offset)
+                if slot_key == key:
+                    rank = (-1, 0)
+                elif slot_key == 0:
+                    rank = (0, 0)
+                elif expires and expires < now:
+                    rank = (1, 0)
+                else:
+                    rank = (2, last_used)
+                if victim_rank is None or rank < victim_rank:
+                    victim, victim_rank = offset, rank
+                if rank[0] < 0:
+                    break
+            if victim_rank[0] > 0:
+                CACHE_EVICTIONS.labels(
+                    ZONE, K8S_APP, "expired" if victim_rank[0] == 1 else "lru"
+                ).inc()
+            expires = 0 if self.ttl is None else now + self.ttl
+            data[victim + _SLOT_HEADER.size : victim + _SLOT_HEADER.size + len(value)] = value
+            _SLOT_HEADER.pack_into(data, victim, key, expires, now, len(value))
+        return True
+
+
+class _SetLock:
+    """Thread lock of the stripe of the set, then record lock of the byte range of the set."""
+
+    def __init__(self, cache: ResponseCache, set_index: int):
+        self.cache = cache
+        self.set_index = set_index
+        self.thread_lock = cache._set_locks[set_index % len(cache._set_locks)]
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.lockf(
+            self.cache._fd, fcntl.LOCK_EX, self.cache.set_size, self.set_index * self.cache.set_size
+        )
+
+    def __exit__(self, *args):
+        fcntl.lockf(
+            self.cache._fd, fcntl.LOCK_UN, self.cache.set_size, self.set_index * self.cache.set_size
+        )
+        self.thread_lock.release()
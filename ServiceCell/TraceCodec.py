@@ -0,0 +1,103 @@
+import argparse
+import json
+import struct
+from typing import Dict, List, Union
+
+# Compact binary encoding of the traces of trace-driven requests. A node is
+#   u32 length of the node | u16 length of the name | name | u32 number of groups |
+#   for each group: u32 number of children | the child nodes
+# so the subtree of a child is a contiguous byte range, forwarded as is to the child,
+# and a cell only reads the names and lengths of its direct children.
+TRACE_CONTENT_TYPE = "application/x-mub-trace"
+
+_U32 = struct.Struct("<I")
+_U16 = struct.Struct("<H")
+
+Subtree = Union[list, memoryview]
+
+
+def _encode_node(name: str, groups: list, out: bytearray):
+    start = len(out)
+    out += b"\0\0\0\0"  # length of the node, written at the end
+    encoded_name = name.encode()
+    out += _U16.pack(len(encoded_name))
+    out += encoded_name
+    out += _U32.pack(len(groups))
+    for group in groups:
+        out += _U32.pack(len(group))
+        for child, child_groups in group.items():
+            _encode_node(child, child_groups, out)
+    _U32.pack_into(out, start, len(out) - start)
+
+
+def encode(trace: dict) -> bytes:
+    """Encodes a JSON trace {service: [{child: [...], ...}, ...]}."""
+    assert len(trace) == 1, "bad trace format"
+    out = bytearray()
+    for name, groups in trace.items():
+        _encode_node(name, groups, out)
+    return bytes(out)
+
+
+def _read_name(data: memoryview, offset: int):
+    name_length = _U16.unpack_from(data, offset + 4)[0]
+    name = bytes(data[offset + 6 : offset + 6 + name_length]).decode()
+    return name, offset + 6 + name_length
+
+
+def decode(data) -> Dict[str, List[Dict[str, Subtree]]]:
+    """
+    Decodes the first level of an encoded trace: {service: [{child: subtree, ...}, ...]},
+    where each subtree is the memoryview of the encoded child node.
+    """
+    data = memoryview(data)
+    name, offset = _read_name(data, 0)
+    group_count = _U32.unpack_from(data, offset)[0]
+    offset += 4
+    groups = list()
+    for _ in range(group_count):
+        child_count = _U32.unpack_from(data, offset)[0]
+        offset += 4
+        group = dict()
+        for _ in range(child_count):
+            length = _U32.unpack_from(data, offset)[0]
+            child, _ = _read_name(data, offset)
+            group[child] = data[offset : offset + length]
+            offset += length
+        groups.append(group)
+    return {name: groups}
+
+
+def to_json(data) -> dict:
+    """Decodes a whole encoded trace, e.g., for debugging."""
+    (name, groups), = decode(data).items()
+    return {
+        name: [
+            {child: to_json(subtree)[child] for child, subtree in group.items()}
+            for group in groups
+        ]
+    }
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description="Converts the JSON traces of trace-driven requests to and from the binary encoding"
+    )
+    parser.add_argument("command", choices=["encode", "decode"])
+    parser.add_argument("input")
+    parser.add_argument("output")
+    args = parser.parse_args()
+    if args.command == "encode":
+        with open(args.input) as f:
+            trace = json.load(f)
+        with open(args.output, "wb") as f:
+            f.write(encode(trace))
+    else:
+        with open(args.input, "rb") as f:
+            trace = to_json(f.read())
+        with open(args.output, "w") as f:
+            json.dump(trace, f)
+
+
+if __name__ == "__main__":
+    _main()
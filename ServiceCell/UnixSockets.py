@@ -0,0 +1,129 @@
+import glob
+import os
+import random
+import socket
+import threading
+import time
+from typing import Optional
+
+import requests
+from prometheus_client import Counter, Summary
+from urllib3.exceptions import NewConnectionError
+
+ZONE = os.environ.get("ZONE", "")  # Pod Zone
+K8S_APP = os.environ.get("K8S_APP", "")  # K8s label app
+
+DEFAULT_SOCKET_DIR = "/var/run/mub"
+
+CALL_LATENCY = Summary(
+    "mub_external_call_latency_seconds",
+    "Latency of the calls to the external services listening on Unix sockets, by network path",
+    ["zone", "app_name", "service", "path"],
+)
+UDS_FALLBACKS = Counter(
+    "mub_uds_fallbacks",
+    "Calls sent over TCP because the Unix socket of a local replica refused the connection",
+    ["zone", "app_name", "service"],
+)
+
+
+def pod_name() -> str:
+    # Kubernetes sets the hostname of the containers to the name of the pod
+    return os.environ.get("HOSTNAME", socket.gethostname())
+
+
+def unix_socket_services(work_model: dict) -> dict:
+    # socket directory of the services listening on Unix sockets
+    return {
+        service: service_model["unix_socket"].get("dir", DEFAULT_SOCKET_DIR)
+        for service, service_model in work_model.items()
+        if "unix_socket" in service_model
+    }
+
+
+def listen_path(service: str, socket_dir: str) -> str:
+    """Unix socket of this pod: one per pod, in a directory per service of the node-shared directory."""
+    service_dir = os.path.join(socket_dir, service)
+    os.makedirs(service_dir, exist_ok=True)
+    return os.path.join(service_dir, f"{pod_name()}.sock")
+
+
+class LocalSockets:
+    """
+    Finds the Unix sockets of the replicas of the external services running on the same node,
+    i.e., those in the directory shared by the pods of the node. The sockets of a service are
+    listed at most every `refresh_s` seconds; a socket refusing connections, e.g., left by a
+    deleted pod, is skipped for `retry_s` seconds.
+    """
+
+    def __init__(self, services: dict, params: dict):
+        self.services = services
+        self.refresh = float(params["refresh_s"])
+        self.retry = float(params["retry_s"])
+        self._sockets = dict()
+        self._failed = dict()
+        self._lock = threading.Lock()
+
+    def uses_uds(self, service: str) -> bool:
+        return service in self.services
+
+    def local_socket(self, service: str) -> Optional[str]:
+        """Returns the socket of a local replica of the service, None to use TCP."""
+        if service not in self.services:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            listed_at, paths = self._sockets.get(service, (None, ()))
+            if listed_at is None or now - listed_at > self.refresh:
+                pattern = os.path.join(self.services[service], service, "*.sock")
+                paths = tuple(glob.glob(pattern))
+                self._sockets[service] = (now, paths)
+            paths = [path for path in paths if self._failed.get(path, 0) <= now]
+        return random.choice(paths) if len(paths) > 0 else None
+
+    def failed(self, service: str, path: str):
+        UDS_FALLBACKS.labels(ZONE, K8S_APP, service).inc()
+        with self._lock:
+            self._failed[path] = time.monotonic() + self.retry
+
+
+def observe(service: str, path: str, start: float):
+    CALL_LATENCY.labels(ZONE, K8S_APP, service, path).observe(time.monotonic() - start)
+
+
+def _refused(err: requests.exceptions.ConnectionError) -> bool:
+    # only calls whose connection could not be opened are safe to send again over TCP
+    return isinstance(getattr(err.args[0] if err.args else None, "reason", None), NewConnectionError)
+
+
+class FallbackSession:
+    """
+    requests.Session-like client of an external service listening on Unix sockets: calls go to the
+    socket of a local replica, if any, else, or if it refuses the connection, to the TCP session.
+    """
+
+    def __init__(self, service: str, local_sockets: LocalSockets, unix_session, tcp_session):
+        self.service = service
+        self.local_sockets = local_sockets
+        self.unix_session = unix_session
+        self.tcp_session = tcp_session
+
+    def request(self, method, url, **kwargs):
+        path = self.local_sockets.local_socket(self.service)
+        if path is not None:
+            start = time.monotonic()
+            try:
+                r = self.unix_session(self.service, path).request(method, url, **kwargs)
+                observe(self.service, "uds", start)
+                return r
+            except requests.exceptions.ConnectionError as err:
+                if not _refused(err):
+                    raise
+                self.local_sockets.failed(self.service, path)
+        start = time.monotonic()
+        r = self.tcp_session.request(method, url, **kwargs)
+        observe(self.service, "tcp", start)
+        return r
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
@@ -0,0 +1,130 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+C = TypeVar("C")
+
+_VERSION_FORMAT = "<Q"
+_CONTROL_SIZE = mmap.PAGESIZE
+
+
+def default_shared_dir() -> str:
+    # /dev/shm is a tmpfs shared by all the processes of the pod
+    shared_dir = os.environ.get("MUB_SHM_DIR")
+    if shared_dir is None:
+        shared_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return shared_dir
+
+
+class SharedWorkModel(Generic[C]):
+    """
+    Publishes the work model of a cell to all its worker processes.
+    The work model is written to a JSON file, while its version is kept in a small
+    mmap'd control file, so that checking for updates costs a memory read.
+    Each process compiles a new version once and swaps its snapshot atomically;
+    in-flight requests keep using the snapshot they started with.
+    """
+
+    def __init__(self, path_prefix: str, compile_fn: Callable[[dict, int], C]):
+        self.control_path = f"{path_prefix}.ctl"
+        self.payload_path = f"{path_prefix}.json"
+        self._compile_fn = compile_fn
+        self._reload_lock = threading.Lock()
+        self._current = None
+        fd = os.open(self.control_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < _CONTROL_SIZE:
+                os.ftruncate(fd, _CONTROL_SIZE)
+            self._control = mmap.mmap(fd, _CONTROL_SIZE)
+        finally:
+            os.close(fd)
+
+    def version(self) -> int:
+        return struct.unpack_from(_VERSION_FORMAT, self._control, 0)[0]
+
+    def publish(self, work_model: dict) -> int:
+        """Publishes a new version of the work model and compiles it in the calling process."""
+        with open(self.control_path, "rb") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                version = self.version() + 1
+                # a work model that does not compile is never published
+                compiled = self._compile_fn(work_model, version)
+                tmp_path = f"{self.payload_path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(work_model, f)
+                os.replace(tmp_path, self.payload_path)
+                self._current = compiled
+                struct.pack_into(_VERSION_FORMAT, self._control, 0, version)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        logger.info("Published work model version %d", version)
+        return version
+
+    def current(self) -> C:
+        """Returns the compiled snapshot of the latest published work model."""
+        current = self._current
+        version = self.version()
+        if current is not None and version == current.version:
+            return current
+        with self._reload_lock:
+            current = self._current
+            if current is None or version != current.version:
+                current = self._reload(version)
+        return current
+
+    def _reload(self, version: int) -> C:
+        try:
+            with open(self.payload_path) as f:
+                work_model = json.load(f)
+            self._current = self._compile_fn(work_model, version)
+            logger.info("Reloaded work model version %d", version)
+        except Exception as err:
+            # keep serving the previous version, and do not retry the broken one
+            logger.error("Unable to reload work model version %d: %s", version, err)
+            self._current = self._current._replace(version=version)
+        return self._current
+
+
+class WorkModelWatcher(threading.Thread):
+    """Publishes the work model again whenever the mounted work model file changes."""
+
+    def __init__(
+        self,
+        path: str,
+        shared_work_model: SharedWorkModel,
+        read_fn: Callable[[], dict],
+        interval: float,
+    ):
+        threading.Thread.__init__(self, daemon=True)
+        self.path = path
+        self.shared_work_model = shared_work_model
+        self.read_fn = read_fn
+        self.interval = interval
+        self._last_stat = self._stat()
+
+    def _stat(self):
+        # ConfigMap updates swap a symlink, stat follows it
+        st = os.stat(self.path)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                stat = self._stat()
+                if stat != self._last_stat:
+                    self._last_stat = stat
+                    logger.info("Work model file %s changed", self.path)
+                    self.shared_work_model.publish(self.read_fn())
+            except Exception as err:
+                logger.error("Error while watching the work model: %s", err)